@@ -1,22 +1,44 @@
-from flask import Flask, render_template, request, jsonify, redirect, session
+from flask import Flask, render_template, request, jsonify, redirect, session, g, Response
+from markupsafe import escape
+import atexit
 import datetime
+import logging
 import os
 import re
+from urllib.parse import urlencode
 from werkzeug.utils import secure_filename
 import random
-import json
 import string
 from flask_mail import Mail, Message
+from mail_queue import MailQueue
+from code_store import create_store, start_sweeper
+from avatars import (
+    AVATARS_DIR, MAX_AVATAR_BYTES, AvatarError, read_upload, store_avatar,
+    ensure_avatar, collect_avatar, avatar_srcset
+)
 from dotenv import load_dotenv
 from functools import wraps
-from database import setup_db, get_connection
+from database import setup_db, get_connection, release_connection, close_pool
+from catalog import get_catalog, catalog
+import catalog_db
+from size_index import nearest_sizes
+from reverse_fit import count_fitting_users, ReverseFitError, DEFAULT_THRESHOLD
+from recommendations import shoe_type_of, user_recommendations, measurements_key
+from fragments import size_table, SIZE_TABLE_TEMPLATE
+import metrics
+from log_config import setup_logging, dropped_records
+from assets import asset_url, asset_manifest, serve_precompressed, compress_response
+from etags import make_etag, catalog_version, template_version, not_modified, with_etag
+from photos import manifest as photo_manifest, model_image, model_photos, VARIANTS_URL_PREFIX, IMMUTABLE_CACHE_CONTROL
 from user_service import (
-    user_exists, save_user_with_verification, get_user_by_email,
+    user_exists, username_exists, save_user_with_verification, get_user_by_email,
     update_user_measurements, update_user_profile,
-    update_user_nickname, get_all_users, verify_user_email, is_email_verified
+    update_user_nickname, iter_users, verify_user_email, USERS_PAGE_SIZE
 )
 
 load_dotenv()
+# Имя задано явно: при запуске python app.py __name__ равен '__main__'
+logger = logging.getLogger('app')
 
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-123456789')
@@ -29,8 +51,22 @@ app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
 
 mail = Mail(app)
+mail_queue = MailQueue(
+    app, mail,
+    workers=int(os.getenv('MAIL_QUEUE_WORKERS', 2)),
+    maxsize=int(os.getenv('MAIL_QUEUE_SIZE', 100))
+)
+
+# Запрос с аватаром отклоняется целиком ещё до чтения тела
+app.config['MAX_CONTENT_LENGTH'] = MAX_AVATAR_BYTES + 64 * 1024
+app.jinja_env.filters['avatar_srcset'] = avatar_srcset
+app.jinja_env.globals['model_image'] = model_image
+app.jinja_env.globals['asset_url'] = asset_url
+app.before_request(metrics.start_request)
+app.after_request(metrics.finish_request)
+app.before_request(serve_precompressed)
+app.after_request(compress_response)
 
-AVATARS_DIR = os.path.join('static', 'avatars')
 ALLOWED_EXT = {'png', 'jpg', 'jpeg', 'gif'}
 USERS_DB = 'users.db'
 
@@ -41,8 +77,7 @@ def ensure_storage():
     if not os.path.exists(AVATARS_DIR):
         os.makedirs(AVATARS_DIR, exist_ok=True)
 
-setup_db()
-ensure_storage()
+app.teardown_appcontext(release_connection)
 
 
 # ------------------ Вспомогательные функции ------------------
@@ -51,8 +86,49 @@ def is_valid_email(email):
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
-pending_registrations = {}
-pending_password_resets = {}
+# Коды хранятся вне процесса (по умолчанию в SQLite), чтобы код,
+# выданный одним воркером, мог проверить любой другой
+CODE_STORE_BACKEND = os.getenv('CODE_STORE', 'sqlite')
+pending_registrations = create_store('verification', CODE_STORE_BACKEND)
+pending_password_resets = create_store('password_reset', CODE_STORE_BACKEND)
+# Сколько раз можно ввести код; попытка засчитывается до сравнения кода
+VERIFY_ATTEMPTS = 3
+RESET_ATTEMPTS = 4
+
+_initialized = False
+
+
+def create_app():
+    """Логи, база, фоновые потоки и метрики процесса; повторный вызов ничего не делает.
+
+    При импорте модуля ничего этого не происходит: процессы spawn
+    из reverse_fit импортируют app.py как __mp_main__, и им нужны
+    только функции, а не свой sweeper, пул соединений и логгер.
+    """
+    global _initialized
+    if _initialized:
+        return app
+    _initialized = True
+
+    setup_logging()
+    setup_db()
+    ensure_storage()
+    atexit.register(close_pool)
+    start_sweeper([pending_registrations, pending_password_resets])
+
+    metrics.register_callback('sneakerfit_catalog_reloads_total', 'Catalog reloads since start',
+                              lambda: catalog.reload_count, kind='counter')
+    metrics.register_callback('sneakerfit_catalog_models', 'Models in the current catalog snapshot',
+                              lambda: len(get_catalog()))
+    metrics.register_callback('sneakerfit_mail_queue_depth', 'Emails waiting to be sent', mail_queue.qsize)
+    metrics.register_callback('sneakerfit_pending_registrations', 'Unexpired email verification codes',
+                              lambda: len(pending_registrations))
+    metrics.register_callback('sneakerfit_log_records_dropped_total', 'Log records dropped on a full log queue',
+                              dropped_records, kind='counter')
+    metrics.register_callback('sneakerfit_pending_password_resets', 'Unexpired password reset codes',
+                              lambda: len(pending_password_resets))
+    return app
+
 
 def send_verification_code(email, username, msg_type="verification"):
     """Отправляет код подтверждения на email"""
@@ -60,13 +136,13 @@ def send_verification_code(email, username, msg_type="verification"):
         code = ''.join(random.choices(string.digits, k=5))
 
         if msg_type == "verification":
-            pending_registrations[email] = {
+            pending_registrations.put(email, {
                 'code': code,
                 'username': username,
                 'timestamp': datetime.datetime.now(),
                 'verified': False,
                 'attempts': 0
-            }
+            })
             subject = 'Подтверждение email - SneakerFit'
             body = f'''Приветствуем, {username}!
 
@@ -79,12 +155,12 @@ def send_verification_code(email, username, msg_type="verification"):
             С уважением,
             Команда SneakerFit'''
         elif msg_type == "password_reset":
-            pending_password_resets[email] = {
+            pending_password_resets.put(email, {
                 'code': code,
                 'timestamp': datetime.datetime.now(),
                 'attempts': 0,
                 'used': False
-            }
+            })
             subject = 'Сброс пароля - SneakerFit'
             body = f'''Приветствуем, {username}!
 
@@ -102,12 +178,17 @@ def send_verification_code(email, username, msg_type="verification"):
             recipients=[email],
             body=body
         )
-        mail.send(msg)
-        print(f"Код {code} отправлен на {email}")
+        # Письмо уходит в фоне, страница подтверждения опрашивает /mail_status
+        job_id = mail_queue.submit(msg)
+        if job_id is None:
+            logger.warning("Mail queue is full, code not sent", extra={'email': email, 'msg_type': msg_type})
+            return False
+        session['mail_job'] = job_id
+        logger.info("Verification code queued", extra={'email': email, 'msg_type': msg_type, 'mail_job': job_id})
         return True
 
-    except Exception as e:
-        print(f"Ошибка отправки email: {e}")
+    except Exception:
+        logger.exception("Ошибка отправки email")
         return False
 
 def update_user_password(email, new_password):
@@ -120,150 +201,24 @@ def update_user_password(email, new_password):
             (new_password, email)
         )
         conn.commit()
-        conn.close()
         return True
-    except Exception as e:
-        print(f"Ошибка обновления пароля: {e}")
+    except Exception:
+        logger.exception("Ошибка обновления пароля")
         return False
 
 def load_shoes_database():
-    try:
-        with open('base_of_shoes.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return {"sneakers": []}
+    return get_catalog().data
 
-def calculate_compatibility(user_data, shoe_size, is_sport=1):
-    compatibility = 0
-    factors = 0
 
-    has_length = user_data.get('foot_length') and str(user_data['foot_length']).strip()
-    has_width = user_data.get('foot_width') and str(user_data['foot_width']).strip()
-    has_oblique = user_data.get('oblique_circumference') and str(user_data['oblique_circumference']).strip()
-    has_foot_type = user_data.get('foot_type') and user_data['foot_type'].strip()
+# ------------------ Пользователь текущего запроса ------------------
 
-    if has_length:
-        try:
-            user_length = float(user_data['foot_length']) * 10
-            shoe_length = shoe_size['length']
-            user_length += 10 if is_sport == 1 else 15
-            length_diff = abs(user_length - shoe_length)
-            if length_diff <= 3:
-                length_score = 45
-            elif length_diff <= 7:
-                length_score = 40
-            elif length_diff <= 12:
-                length_score = 35
-            elif length_diff <= 17:
-                length_score = 25
-            elif length_diff <= 22:
-                length_score = 15
-            else:
-                length_score = 5
-            compatibility += length_score
-            factors += 46
-        except ValueError:
-            pass
-
-    if has_width:
-        try:
-            user_width = float(user_data['foot_width']) * 10
-            estimated_midfoot = 2 * (user_width + 50) * 0.9
-            user_width += 10 if is_sport == 1 else 15
-            shoe_midfoot = shoe_size['midfootCircumference']
-            width_diff = abs(estimated_midfoot - shoe_midfoot)
-            if width_diff <= 15:
-                width_score = 35
-            elif width_diff <= 25:
-                width_score = 30
-            elif width_diff <= 35:
-                width_score = 25
-            elif width_diff <= 45:
-                width_score = 18
-            elif width_diff <= 55:
-                width_score = 10
-            else:
-                width_score = 5
-            compatibility += width_score
-            factors += 29
-        except ValueError:
-            pass
-
-    if has_oblique:
-        try:
-            user_oblique = float(user_data['oblique_circumference']) * 10
-            shoe_oblique = shoe_size['obliqueCircumference']
-            user_oblique += 10 if is_sport == 1 else 15
-            oblique_diff = abs(user_oblique - shoe_oblique)
-            if oblique_diff <= 10:
-                oblique_score = 15
-            elif oblique_diff <= 20:
-                oblique_score = 12
-            elif oblique_diff <= 30:
-                oblique_score = 8
-            elif oblique_diff <= 40:
-                oblique_score = 5
-            else:
-                oblique_score = 2
-            compatibility += oblique_score
-            factors += 17
-        except ValueError:
-            pass
-
-    if has_foot_type:
-        foot_type = user_data['foot_type']
-        if foot_type == 'Плоскостопие':
-            ankle_circ = shoe_size['ankleCircumference']
-            midfoot_circ = shoe_size['midfootCircumference']
-            foot_type_score = 5 if ankle_circ > 240 and midfoot_circ > 220 else 3 if ankle_circ > 230 and midfoot_circ > 210 else 1
-        elif foot_type == 'Супинация':
-            toe_circ = shoe_size['toeCircumference']
-            foot_type_score = 5 if toe_circ > 240 else 3 if toe_circ > 220 else 1
-        else:
-            foot_type_score = 4
-        compatibility += foot_type_score
-        factors += 8
-
-    final_compatibility = min(98, int(compatibility * 100 / factors)) if factors > 0 else 0
-
-    if has_length:
-        user_length = float(user_data['foot_length']) * 10
-        shoe_length = shoe_size['length'] + (4 if is_sport == 1 else 6)
-        if abs(user_length - shoe_length) <= 2:
-            final_compatibility = min(100, final_compatibility + 5)
-
-    return final_compatibility
-
-def find_best_matches(user_email):
-    user = get_user_by_email(user_email)
-    if not user:
-        return []
-
-    shoes_db = load_shoes_database()
-    recommendations = []
-
-    for shoe in shoes_db['sneakers']:
-        best_compatibility = 0
-        best_size = None
-        for size in shoe['sizes']:
-            compatibility = calculate_compatibility({
-                'foot_length': user.get('foot_length'),
-                'foot_width': user.get('foot_width'),
-                'arch': user.get('arch'),
-                'foot_type': user.get('foot_type')
-            }, size, is_sport=shoe.get('sport', 1))
-            if compatibility > best_compatibility:
-                best_compatibility = compatibility
-                best_size = size
-        if best_compatibility >= 30:
-            recommendations.append({
-                'model': shoe['model'],
-                'compatibility': best_compatibility,
-                'best_size': best_size,
-                'all_sizes': shoe['sizes']
-            })
-    recommendations.sort(key=lambda x: x['compatibility'], reverse=True)
-    return recommendations[:8]
+def load_current_user():
+    """Пользователь из сессии; запрос к базе — один раз за HTTP-запрос"""
+    if 'current_user' not in g:
+        email = session.get('user_email')
+        g.current_user = get_user_by_email(email) if email else None
+        g.user_loads = g.get('user_loads', 0) + 1
+    return g.current_user
 
 
 # ------------------ Декораторы для проверки авторизации ------------------
@@ -284,8 +239,8 @@ def email_verified_required(f):
         if not session.get('user_logged_in'):
             return redirect('/login_page')
 
-        user_email = session.get('user_email')
-        if not user_email or not is_email_verified(user_email):
+        user = load_current_user()
+        if not user or not user.get('email_verified'):
             session['redirect_after_verification'] = request.url
             return redirect('/verify_email_page')
 
@@ -294,62 +249,123 @@ def email_verified_required(f):
     return decorated_function
 
 
+# Адреса администраторов через запятую
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv('ADMIN_EMAILS', '').split(',') if e.strip()}
+
+
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('user_logged_in'):
+            return redirect('/login_page')
+        if (session.get('user_email') or '').lower() not in ADMIN_EMAILS:
+            return "Доступ запрещён", 403
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+@app.after_request
+def cache_fingerprinted_photos(response):
+    if request.path.startswith(VARIANTS_URL_PREFIX) and not request.path.endswith('.json'):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+# ------------------ Условные GET ------------------
+
+def render_static_page(template_name):
+    """Страница без данных пользователя; ETag — из версий шаблона и статики"""
+    etag = make_etag(template_name, template_version(template_name), asset_manifest.version(),
+                     bool(session.get('user_logged_in')))
+    return not_modified(etag) or with_etag(render_template(template_name), etag)
+
+
 # ------------------ Роуты(ссылки) ------------------
 
 @app.route('/')
 def first():
-    return render_template('first_page.html')
+    return render_static_page('first_page.html')
 
 
 @app.route('/shoe/<model_name>')
 @email_verified_required
 def shoe_detail(model_name):
-    shoes_db = load_shoes_database()
-    shoe = None
-    for s in shoes_db['sneakers']:
-        if s['model'] == model_name:
-            shoe = s
-            break
+    version = catalog_db.mirror_version()
+    shoe = catalog_db.get_shoe(model_name)
     if not shoe:
         return "Модель не найдена", 404
 
-    user = get_user_by_email(session.get('user_email'))
+    user = load_current_user()
     if not user:
         return redirect('/login_page')
 
-    sizes_compatibility = []
-    for size in shoe['sizes']:
-        compatibility = calculate_compatibility({
-            'foot_length': user.get('foot_length'),
-            'foot_width': user.get('foot_width'),
-            'oblique_circumference': user.get('oblique_circumference'),
-            'foot_type': user.get('foot_type')
-        }, size, is_sport=shoe.get('sport', 1))
-
-        sizes_compatibility.append({
-            'size_data': size,
-            'compatibility': compatibility
-        })
-
-    sizes_compatibility.sort(key=lambda x: x['compatibility'], reverse=True)
-
-    return render_template('shoe_detail.html',
-                           shoe=shoe, sizes=sizes_compatibility, user=user)
+    photos = model_photos(shoe['model'])
+    etag = make_etag(
+        'shoe_detail.html', template_version('shoe_detail.html'), template_version(SIZE_TABLE_TEMPLATE),
+        asset_manifest.version(), version, shoe['model'], photos,
+        *(user.get(field) for field in ('foot_length', 'foot_width', 'arch', 'oblique_circumference', 'foot_type'))
+    )
+    response = not_modified(etag)
+    if response:
+        return response
+
+    # Блок размеров одинаков для одинаковых мерок и берётся из кеша
+    return with_etag(render_template('shoe_detail.html',
+                                     shoe=shoe, sizes_html=size_table(shoe, user, version), user=user,
+                                     photos=photos), etag)
+
+
+@app.route('/get_shoe_photos')
+def get_shoe_photos():
+    """Список фотографий модели для галереи"""
+    shoe = catalog_db.get_shoe(request.args.get('model', ''))
+    if not shoe:
+        return jsonify({'success': False, 'message': 'Модель не найдена'}), 404
+    return jsonify({'success': True, 'photos': model_photos(shoe['model'])})
 
 
 @app.route('/get_shoe_type')
 def get_shoe_type():
     model_name = request.args.get('model', '')
-    shoes_db = load_shoes_database()
+    sports = catalog_db.get_shoe_sports([model_name])
 
-    for shoe in shoes_db['sneakers']:
-        if shoe['model'] == model_name:
-            shoe_type = 'sport' if shoe.get('sport', 1) == 1 else 'casual'
-            return jsonify({'shoeType': shoe_type})
+    if model_name in sports:
+        return jsonify({'shoeType': shoe_type_of({'sport': sports[model_name]})})
 
     return jsonify({'shoeType': 'sport'})
 
 
+MAX_SHOE_TYPES = 500
+
+
+@app.route('/get_shoe_types')
+def get_shoe_types():
+    """Типы сразу нескольких моделей: ?model=...&model=... или ?models=a,b"""
+    model_names = request.args.getlist('model')
+    if request.args.get('models'):
+        model_names += [name.strip() for name in request.args['models'].split(',') if name.strip()]
+
+    model_names = model_names[:MAX_SHOE_TYPES]
+    sports = catalog_db.get_shoe_sports(model_names)
+    shoe_types = {}
+    for model_name in model_names:
+        shoe_types[model_name] = shoe_type_of({'sport': sports[model_name]}) if model_name in sports else 'sport'
+    return jsonify({'shoeTypes': shoe_types})
+
+
+@app.route('/find_sizes')
+def find_sizes():
+    """Размеры каталога: ?length_min=&length_max= (мм), ?eu=, ?sport=0|1, ?limit="""
+    return jsonify(catalog_db.find_sizes(
+        length_min=request.args.get('length_min', type=float),
+        length_max=request.args.get('length_max', type=float),
+        eu=request.args.get('eu', type=float),
+        sport=request.args.get('sport', type=int),
+        limit=max(request.args.get('limit', 100, type=int), 1)
+    ))
+
+
 # ------------------ Регистрация и подтверждение email ------------------
 
 @app.route('/register_page')
@@ -379,10 +395,7 @@ def login():
         email = request.form.get('email', '').strip()
         password = request.form.get('password', '').strip()
 
-        print(f"=== DEBUG LOGIN ===")
-        print(f"Email: '{email}'")
-        print(f"Password entered: '{password}'")
-        print(f"Password length: {len(password)}")
+        logger.debug("Login attempt", extra={'email': email})
 
         if not email or not password:
             return jsonify({'success': False, 'message': 'Введите email и пароль'})
@@ -392,13 +405,8 @@ def login():
         if not user:
             return jsonify({'success': False, 'message': 'Пользователь не найден'})
 
-        print(f"User found: {bool(user)}")
-        if user:
-            print(f"Stored password: '{user['password']}'")
-            print(f"Stored password length: {len(user['password'])}")
-            print(f"Passwords match: {user['password'] == password}")
-
         if user['password'] != password:
+            logger.info("Login failed: wrong password", extra={'email': email})
             return jsonify({'success': False, 'message': 'Неверный пароль'})
 
         if not user.get('email_verified'):
@@ -425,7 +433,7 @@ def login():
         })
 
     except Exception as e:
-        print(f"Error in login: {e}")
+        logger.exception("Error in login")
         return jsonify({'success': False, 'message': f'Ошибка сервера: {str(e)}'})
 
 
@@ -436,7 +444,7 @@ def register():
         email = request.form.get('email', '').strip()
         password = request.form.get('password', '').strip()
 
-        print(f"Registration attempt: {username}, {email}")
+        logger.debug("Registration attempt", extra={'username': username, 'email': email})
 
         if not username or not email or not password:
             return jsonify({'success': False, 'message': 'Все поля обязательны'})
@@ -454,6 +462,8 @@ def register():
             return jsonify({'success': False, 'message': 'Пароль не может состоять только из букв'})
         if user_exists(email):
             return jsonify({'success': False, 'message': 'Пользователь уже существует'})
+        if username_exists(username):
+            return jsonify({'success': False, 'message': 'Такой ник уже существует'})
 
         if not send_verification_code(email, username):
             return jsonify({'success': False, 'message': 'Ошибка отправки кода подтверждения'})
@@ -469,7 +479,7 @@ def register():
         })
 
     except Exception as e:
-        print(f"Error in register: {e}")
+        logger.exception("Error in register")
         return jsonify({'success': False, 'message': f'Ошибка сервера: {str(e)}'})
 
 
@@ -488,24 +498,25 @@ def verify_email():
         if not email or not username:
             return jsonify({'success': False, 'message': 'Сессия истекла. Начните регистрацию заново.'})
 
-        if email not in pending_registrations:
+        verification_data = pending_registrations.get(email)
+        if verification_data is None:
             return jsonify({'success': False, 'message': 'Код не найден или истек'})
 
-        verification_data = pending_registrations[email]
-
         time_diff = datetime.datetime.now() - verification_data['timestamp']
         if time_diff.total_seconds() > 900:
-            del pending_registrations[email]
+            pending_registrations.delete(email)
             return jsonify({'success': False, 'message': 'Код истек. Запросите новый.'})
 
-        if verification_data['code'] != code:
-            verification_data.setdefault('attempts', 0)
-            verification_data['attempts'] += 1
+        # Атомарный счётчик: параллельные запросы не обойдут лимит
+        attempt = pending_registrations.register_attempt(email, VERIFY_ATTEMPTS)
+        if attempt is None:
+            pending_registrations.delete(email)
+            return jsonify({'success': False, 'message': 'Слишком много попыток. Запросите новый код.'})
 
-            if verification_data['attempts'] >= 3:
-                del pending_registrations[email]
+        if verification_data['code'] != code:
+            if attempt >= VERIFY_ATTEMPTS:
+                pending_registrations.delete(email)
                 return jsonify({'success': False, 'message': 'Слишком много попыток. Запросите новый код.'})
-
             return jsonify({'success': False, 'message': 'Неверный код'})
 
         success = save_user_with_verification({
@@ -525,7 +536,7 @@ def verify_email():
         session['user_email'] = email
         session['user_name'] = username
 
-        del pending_registrations[email]
+        pending_registrations.delete(email)
         session.pop('pending_email', None)
         session.pop('pending_username', None)
         session.pop('pending_password', None)
@@ -539,7 +550,7 @@ def verify_email():
         })
 
     except Exception as e:
-        print(f"Error in verify_email: {e}")
+        logger.exception("Error in verify_email")
         return jsonify({'success': False, 'message': f'Ошибка сервера: {str(e)}'})
 
 
@@ -551,16 +562,17 @@ def resend_verification_code():
 
         if not email:
             return jsonify({'success': False, 'message': 'Сессия истекла'})
-        if email in pending_registrations:
+        verification_data = pending_registrations.get(email)
+        if verification_data is not None:
             username = session.get('pending_username', 'Пользователь')
-            last_send = pending_registrations[email].get('last_resend')
+            last_send = verification_data.get('last_resend')
             if last_send:
                 time_diff = datetime.datetime.now() - last_send
                 if time_diff.total_seconds() < 60:
                     return jsonify({'success': False, 'message': 'Подождите 60 секунд перед повторной отправкой'})
 
             send_verification_code(email, username)
-            pending_registrations[email]['last_resend'] = datetime.datetime.now()
+            pending_registrations.update(email, last_resend=datetime.datetime.now())
 
             return jsonify({'success': True, 'message': 'Код отправлен повторно'})
         else:
@@ -569,10 +581,20 @@ def resend_verification_code():
             return jsonify({'success': True, 'message': 'Код отправлен'})
 
     except Exception as e:
-        print(f"Error in resend_verification_code: {e}")
+        logger.exception("Error in resend_verification_code")
         return jsonify({'success': False, 'message': f'Ошибка сервера: {str(e)}'})
 
 
+@app.route('/mail_status')
+def mail_status():
+    """Состояние последнего письма с кодом: queued, sending, sent или failed"""
+    job_id = session.get('mail_job')
+    status = mail_queue.status(job_id) if job_id else None
+    if not status:
+        return jsonify({'state': 'unknown'})
+    return jsonify({'state': status['state'], 'attempts': status.get('attempts', 0)})
+
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -616,8 +638,9 @@ def forgot_password():
         if not user:
             return jsonify({'success': False, 'message': 'Пользователь с таким email не найден'})
 
-        if email in pending_password_resets:
-            time_diff = datetime.datetime.now() - pending_password_resets[email]['timestamp']
+        reset_data = pending_password_resets.get(email)
+        if reset_data is not None:
+            time_diff = datetime.datetime.now() - reset_data['timestamp']
             if time_diff.total_seconds() < 60:
                 return jsonify({
                     'success': False,
@@ -635,7 +658,7 @@ def forgot_password():
             'redirect': '/reset_password_page'
         })
     except Exception as e:
-        print(f"Ошибка в forgot_password: {e}")
+        logger.exception("Ошибка в forgot_password")
         return jsonify({'success': False, 'message': f'Ошибка сервера: {str(e)}'})
 
 
@@ -645,11 +668,7 @@ def verify_reset_code():
     try:
         code = request.form.get('code', '').strip()
 
-        print(f"=== DEBUG verify_reset_code ===")
-        print(f"Code: {code}")
-        print(f"Session keys: {list(session.keys())}")
-        print(f"Reset email in session: {session.get('reset_email')}")
-        print(f"Reset username in session: {session.get('reset_username')}")
+        logger.debug("Reset code check", extra={'email': session.get('reset_email')})
 
         if not code:
             return jsonify({'success': False, 'message': 'Введите код подтверждения'})
@@ -659,28 +678,27 @@ def verify_reset_code():
         if not email:
             return jsonify({'success': False, 'message': 'Сессия истекла'})
 
-        if email not in pending_password_resets:
+        reset_data = pending_password_resets.get(email)
+        if reset_data is None:
             return jsonify({'success': False, 'message': 'Код не найден или истек'})
 
-        reset_data = pending_password_resets[email]
-
         time_diff = datetime.datetime.now() - reset_data['timestamp']
         if time_diff.total_seconds() > 900:
-            del pending_password_resets[email]
+            pending_password_resets.delete(email)
             return jsonify({'success': False, 'message': 'Код истек. Запросите новый.'})
 
-        if reset_data.get('attempts', 0) >= 4:
-            del pending_password_resets[email]
+        # Атомарный счётчик: параллельные запросы не обойдут лимит
+        if pending_password_resets.register_attempt(email, RESET_ATTEMPTS) is None:
+            pending_password_resets.delete(email)
             return jsonify({'success': False, 'message': 'Слишком много попыток. Запросите новый код.'})
 
         if reset_data['code'] != code:
-            reset_data['attempts'] = reset_data.get('attempts', 0) + 1
             return jsonify({'success': False, 'message': 'Неверный код'})
 
-        reset_data['used'] = True
+        if not pending_password_resets.mark_used(email):
+            return jsonify({'success': False, 'message': 'Код не найден или истек'})
 
-        print(f"=== DEBUG Code verified successfully ===")
-        print(f"Redirecting to change_password_page")
+        logger.info("Reset code verified", extra={'email': email})
 
         return jsonify({
             'success': True,
@@ -689,7 +707,7 @@ def verify_reset_code():
         })
 
     except Exception as e:
-        print(f"Ошибка в verify_reset_code: {e}")
+        logger.exception("Ошибка в verify_reset_code")
         return jsonify({'success': False, 'message': f'Ошибка сервера: {str(e)}'})
 
 
@@ -701,10 +719,7 @@ def change_password():
         new_password = request.form.get('new_password', '').strip()
         confirm_password = request.form.get('confirm_password', '').strip()
 
-        print(f"=== DEBUG change_password ===")
-        print(f"Email from session: {email}")
-        print(f"User email: {session.get('user_email')}")
-        print(f"Reset email: {session.get('reset_email')}")
+        logger.debug("Password change", extra={'email': email, 'reset': 'reset_email' in session})
         if not email:
             return jsonify({'success': False, 'message': 'Сессия истекла'})
         if not new_password or not confirm_password:
@@ -722,14 +737,16 @@ def change_password():
         if user and new_password == user['username']:
             return jsonify({'success': False, 'message': 'Пароль не может совпадать с логином'})
 
+        # Без входа пароль меняется только по подтверждённому коду, и код при этом гасится
+        if 'user_email' not in session and not pending_password_resets.take_used(email):
+            return jsonify({'success': False, 'message': 'Код сброса не подтверждён'})
+
         if not update_user_password(email, new_password):
             return jsonify({'success': False, 'message': 'Ошибка обновления пароля'})
 
         if 'reset_email' in session:
             session.pop('reset_email', None)
             session.pop('reset_username', None)
-            if email in pending_password_resets:
-                del pending_password_resets[email]
 
         if 'user_email' not in session:
             session['user_logged_in'] = True
@@ -742,7 +759,7 @@ def change_password():
             'redirect': '/profile'
         })
     except Exception as e:
-        print(f"Ошибка в change_password: {e}")
+        logger.exception("Ошибка в change_password")
         return jsonify({'success': False, 'message': f'Ошибка сервера: {str(e)}'})
 
 
@@ -759,8 +776,9 @@ def resend_reset_code():
         if not user:
             return jsonify({'success': False, 'message': 'Пользователь не найден'})
 
-        if email in pending_password_resets:
-            last_send = pending_password_resets[email].get('last_resend')
+        reset_data = pending_password_resets.get(email)
+        if reset_data is not None:
+            last_send = reset_data.get('last_resend')
             if last_send:
                 time_diff = datetime.datetime.now() - last_send
                 if time_diff.total_seconds() < 60:
@@ -770,18 +788,18 @@ def resend_reset_code():
                     })
 
         send_verification_code(email, user['username'], "password_reset")
-        pending_password_resets[email]['last_resend'] = datetime.datetime.now()
+        pending_password_resets.update(email, last_resend=datetime.datetime.now())
 
         return jsonify({'success': True, 'message': 'Код отправлен повторно'})
 
     except Exception as e:
-        print(f"Ошибка в resend_reset_code: {e}")
+        logger.exception("Ошибка в resend_reset_code")
         return jsonify({'success': False, 'message': f'Ошибка сервера: {str(e)}'})
 
 @app.route('/profile')
 @email_verified_required
 def profile():
-    user = get_user_by_email(session.get('user_email'))
+    user = load_current_user()
     return render_template('profile.html', user=user)
 
 
@@ -790,22 +808,30 @@ def profile():
 def profile_update():
     email = session.get('user_email')
     about = request.form.get('about', '').strip()
+    user = load_current_user()
+    old_avatar = user.get('avatar') if user else None
 
     file = request.files.get('avatar')
     avatar_web_path = None
+    avatar_data = None
     if file and file.filename:
         filename = secure_filename(file.filename)
         ext = filename.rsplit('.', 1)[-1].lower()
         if ext not in ALLOWED_EXT:
             return "Неподдерживаемый формат изображения", 400
 
-        unique = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
-        new_name = f"{session.get('user_email').split('@')[0]}_{unique}.{ext}"
-        save_path = os.path.join(AVATARS_DIR, new_name)
-        file.save(save_path)
-        avatar_web_path = os.path.join('static', 'avatars', new_name).replace('\\', '/')
+        try:
+            avatar_data = read_upload(file)
+            avatar_web_path = store_avatar(avatar_data)
+        except AvatarError as e:
+            return str(e), 400
 
     update_user_profile(email, about=about if about != '' else '', avatar_path=avatar_web_path)
+    if avatar_data:
+        # Тот же файл мог удалить сборщик до нашего коммита; теперь ссылка его защищает
+        ensure_avatar(avatar_data)
+    if avatar_web_path and old_avatar and old_avatar != avatar_web_path:
+        collect_avatar(old_avatar)
     return redirect('/profile')
 
 
@@ -815,7 +841,7 @@ def nickname_update():
     new_name = request.form.get('new_nickname', '').strip()
     if len(new_name) < 3:
         return "Имя слишком короткое"
-    if new_name in [u['username'] for u in get_all_users()]:
+    if username_exists(new_name):
         return "Такой ник уже существует"
     update_user_nickname(session.get('user_email'), new_name)
     session['user_name'] = new_name
@@ -825,7 +851,7 @@ def nickname_update():
 @app.route('/measure', methods=['GET', 'POST'])
 @email_verified_required
 def measure():
-    user = get_user_by_email(session.get('user_email'))
+    user = load_current_user()
     if request.method == 'POST':
         length = request.form.get('length', '').strip()
         width = request.form.get('width', '').strip()
@@ -855,37 +881,97 @@ def measure():
 @app.route('/get_recommendations')
 @login_required
 def get_recommendations():
-    if not is_email_verified(session.get('user_email')):
+    user = load_current_user()
+    if not user or not user.get('email_verified'):
         return jsonify({'error': 'Email not verified', 'redirect': '/verify_email_page'})
 
-    recommendations = find_best_matches(session.get('user_email'))
-    return jsonify(recommendations)
+    # Ответ зависит только от каталога, мерок и манифеста фотографий
+    etag = make_etag('recommendations', catalog_version(get_catalog()), measurements_key(user),
+                     photo_manifest.version())
+    return not_modified(etag) or with_etag(jsonify(user_recommendations(user)), etag)
+
+
+@app.route('/get_best_sizes')
+@login_required
+def get_best_sizes():
+    """Лучшие отдельные размеры из всего каталога, любых брендов"""
+    user = load_current_user()
+    if not user or not user.get('email_verified'):
+        return jsonify({'error': 'Email not verified', 'redirect': '/verify_email_page'})
+
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    return jsonify(nearest_sizes({
+        'foot_length': user.get('foot_length'),
+        'foot_width': user.get('foot_width'),
+        'oblique_circumference': user.get('oblique_circumference'),
+        'foot_type': user.get('foot_type')
+    }, get_catalog(), limit))
+
+
+MAX_USERS_PAGE_SIZE = 1000
 
 
 @app.route('/users')
+@admin_required
 def view_users():
-    users = get_all_users()
-    html = "<h1>Пользователи</h1><table border='1'><tr><th>Имя</th><th>Email</th><th>Подтвержден</th></tr>"
-    for u in users:
-        verified = "Да" if u.get('email_verified') else "Нет"
-        html += f"<tr><td>{u['username']}</td><td>{u['email']}</td><td>{verified}</td></tr>"
-    html += "</table>"
-    return html
+    """Список пользователей постранично: ?after=<id>&limit=<n>&q=<начало имени или email>"""
+    after_id = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', USERS_PAGE_SIZE, type=int), 1), MAX_USERS_PAGE_SIZE)
+    prefix = request.args.get('q', '').strip()
+    # Страницу читаем до ответа: запросы генератора прошли бы мимо метрик запроса
+    users = list(iter_users(after_id, limit, prefix))
+
+    def generate():
+        yield (f"<h1>Пользователи</h1><form method='get'>"
+               f"<input name='q' value='{escape(prefix)}' placeholder='Имя или email'>"
+               f"<button>Найти</button></form>"
+               "<table border='1'><tr><th>Имя</th><th>Email</th><th>Подтвержден</th></tr>")
+        for u in users:
+            verified = "Да" if u['email_verified'] else "Нет"
+            yield f"<tr><td>{escape(u['username'])}</td><td>{escape(u['email'])}</td><td>{verified}</td></tr>"
+        yield "</table>"
+        if len(users) == limit:
+            query = {'after': users[-1]['id'], 'limit': limit}
+            if prefix:
+                query['q'] = prefix
+            yield f"<p><a href='/users?{escape(urlencode(query))}'>Дальше →</a></p>"
+
+    return Response(generate(), mimetype='text/html')
+
+
+@app.route('/admin/reverse_fit')
+@admin_required
+def reverse_fit():
+    """Сколько пользователей подходит к размеру: ?model=&eu=&threshold="""
+    eu = request.args.get('eu', type=float)
+    if eu is None:
+        return jsonify({'success': False, 'message': 'Укажите размер EU'}), 400
+    threshold = min(max(request.args.get('threshold', DEFAULT_THRESHOLD, type=int), 0), 100)
+    try:
+        result = count_fitting_users(request.args.get('model', ''), eu, threshold)
+    except ReverseFitError as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
+    return jsonify({'success': True, **result})
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/get_random_shoe')
 def get_random_shoe():
     try:
-        shoes_db = load_shoes_database()
-        if not shoes_db.get('sneakers'):
+        sneakers = get_catalog().sneakers
+        if not sneakers:
             return jsonify({'error': 'No shoes available'})
-        random_shoe = random.choice(shoes_db['sneakers'])
+        random_shoe = random.choice(sneakers)
         return jsonify({
             'model': random_shoe['model'],
             'sizes_available': len(random_shoe['sizes'])
         })
-    except Exception as e:
-        print(f"Error getting random shoe: {e}")
+    except Exception:
+        logger.exception("Error getting random shoe")
         return jsonify({'error': 'Failed to load shoe data'})
 
 
@@ -893,12 +979,12 @@ def get_random_shoe():
 
 @app.route("/about")
 def about():
-    return render_template("about.html")
+    return render_static_page("about.html")
 
 
 @app.route("/how")
 def how():
-    return render_template("how.html")
+    return render_static_page("how.html")
 
 
 @app.route("/fit")
@@ -908,4 +994,7 @@ def fit():
 
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
+elif __name__ != '__mp_main__':
+    # gunicorn app:app и прочие импорты получают готовое приложение
+    create_app()
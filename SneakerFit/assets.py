@@ -0,0 +1,116 @@
+import gzip
+import json
+import logging
+import mimetypes
+import os
+import threading
+
+from flask import request, send_from_directory, url_for
+
+from build_assets import ASSETS_MANIFEST_FILE, DIST_DIR
+from etags import GZIP_SUFFIX
+from photos import IMMUTABLE_CACHE_CONTROL
+
+logger = logging.getLogger(__name__)
+
+DIST_URL_PREFIX = '/static/dist/'
+# Готовые сжатые копии в порядке предпочтения
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+# JSON меньше этого размера отдаётся как есть: сжатие не окупается
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+
+
+class AssetManifest:
+    """Манифест собранной статики, перечитывается при изменении файла"""
+
+    def __init__(self, path=ASSETS_MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._stamp = None
+
+    def assets(self):
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._assets = self._load() if stamp else {}
+                    self._stamp = stamp
+        return self._assets
+
+    def version(self):
+        """Отметка файла, из которого загружен манифест"""
+        self.assets()
+        return self._stamp
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            logger.exception("Error loading asset manifest")
+            return {}
+
+
+asset_manifest = AssetManifest()
+
+
+def asset_url(filename):
+    """Ссылка на файл статики; если сборки нет — на исходный файл"""
+    return url_for('static', filename=asset_manifest.assets().get(filename, filename))
+
+
+def _accepted_encodings():
+    return {value.lower() for value, _ in request.accept_encodings}
+
+
+def serve_precompressed():
+    """before_request: отдаёт .br/.gz копию собранного файла, если клиент её принимает"""
+    if not request.path.startswith(DIST_URL_PREFIX) or request.method not in ('GET', 'HEAD'):
+        return None
+    filename = request.path[len(DIST_URL_PREFIX):]
+    if filename == 'manifest.json':
+        return None
+    accepted = _accepted_encodings()
+    for encoding, suffix in PRECOMPRESSED:
+        compressed = os.path.join(DIST_DIR, filename + suffix)
+        if encoding in accepted and os.path.isfile(compressed):
+            response = send_from_directory(
+                DIST_DIR, filename + suffix,
+                mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            )
+            response.headers.pop('Content-Disposition', None)
+            response.headers['Content-Encoding'] = encoding
+            response.headers['Vary'] = 'Accept-Encoding'
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            return response
+    return None
+
+
+def compress_response(response):
+    """after_request: сжимает gzip'ом крупные JSON-ответы и помечает собранную статику"""
+    if request.path.startswith(DIST_URL_PREFIX) and not request.path.endswith('manifest.json'):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
+
+    if (response.mimetype != 'application/json' or response.direct_passthrough
+            or response.status_code != 200 or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in _accepted_encodings():
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + GZIP_SUFFIX, weak)
+    return response
@@ -0,0 +1,170 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from database import release_connection
+from user_service import collect_unused_avatar
+
+logger = logging.getLogger(__name__)
+
+AVATARS_DIR = os.path.join('static', 'avatars')
+MAX_AVATAR_BYTES = 5 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Аватар показывается в круге 180px: обычная и удвоенная плотность
+AVATAR_SIZES = (180, 360)
+AVATAR_FORMAT = 'WEBP'
+AVATAR_EXT = 'webp'
+AVATAR_QUALITY = 82
+# Сжатая картинка в пределах MAX_AVATAR_BYTES может разворачиваться в гигапиксели:
+# размеры проверяются по заголовку, до декодирования
+MAX_AVATAR_PIXELS = 25_000_000
+
+# Предупреждение Pillow о «бомбе» становится ошибкой: такие картинки
+# отклоняются, а не декодируются с записью в лог
+warnings.simplefilter('error', Image.DecompressionBombWarning)
+
+# static/avatars/<sha256[:20]>_<size>.webp
+CONTENT_NAME = re.compile(r'^static/avatars/([0-9a-f]{20})_\d+\.' + AVATAR_EXT + '$')
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='avatar')
+
+
+class AvatarError(ValueError):
+    pass
+
+
+def read_upload(file, limit=MAX_AVATAR_BYTES):
+    """Читает загруженный файл кусками, не больше limit байт"""
+    buffer = io.BytesIO()
+    while True:
+        chunk = file.stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if buffer.tell() + len(chunk) > limit:
+            raise AvatarError("Файл слишком большой")
+        buffer.write(chunk)
+    return buffer.getvalue()
+
+
+def open_image(data):
+    """Открывает картинку, отказывая слишком большим по числу пикселей"""
+    try:
+        image = Image.open(io.BytesIO(data))
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise AvatarError("Изображение слишком большое")
+    width, height = image.size
+    if width * height > MAX_AVATAR_PIXELS:
+        image.close()
+        raise AvatarError("Изображение слишком большое")
+    return image
+
+
+def variant_path(digest, size):
+    return os.path.join(AVATARS_DIR, f"{digest}_{size}.{AVATAR_EXT}")
+
+
+def web_path(path):
+    return path.replace('\\', '/')
+
+
+def _render(data, digest, sizes):
+    missing = [size for size in sizes if not os.path.exists(variant_path(digest, size))]
+    if not missing:
+        return
+    with open_image(data) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size in missing:
+            path = variant_path(digest, size)
+            thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            # Пишем во временный файл и переименовываем, чтобы не отдать недописанный
+            tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            thumb.save(tmp_path, AVATAR_FORMAT, quality=AVATAR_QUALITY)
+            os.replace(tmp_path, path)
+
+
+def ensure_avatar(data):
+    """Создаёт недостающие размеры аватара; возвращает web-путь основной миниатюры.
+
+    Основная миниатюра пишется сразу — ссылка на неё работает уже в
+    ответе на загрузку. Крупные размеры дорисовываются в фоне.
+    """
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    _render(data, digest, AVATAR_SIZES[:1])
+
+    def process():
+        try:
+            _render(data, digest, AVATAR_SIZES[1:])
+        except Exception:
+            logger.exception("Error processing avatar", extra={'digest': digest})
+
+    _executor.submit(process)
+    return web_path(variant_path(digest, AVATAR_SIZES[0]))
+
+
+def store_avatar(data):
+    """Проверяет картинку и сохраняет её миниатюры.
+
+    Имя файла — хеш содержимого, поэтому одинаковые загрузки хранятся
+    один раз. Возвращает web-путь основной миниатюры.
+    """
+    try:
+        with open_image(data) as image:
+            image.verify()
+    except AvatarError:
+        raise
+    except Exception:
+        raise AvatarError("Файл не является изображением")
+    try:
+        return ensure_avatar(data)
+    except Exception:
+        logger.exception("Error processing avatar")
+        raise AvatarError("Не удалось обработать изображение")
+
+
+def avatar_srcset(avatar):
+    """srcset для аватара; для старых загрузок без вариантов — пустая строка"""
+    match = CONTENT_NAME.match(avatar or '')
+    if not match:
+        return ''
+    return ', '.join(f"/{web_path(variant_path(match.group(1), size))} {size}w" for size in AVATAR_SIZES)
+
+
+def remove_avatar(avatar):
+    """Удаляет файлы аватара: все размеры или старый одиночный файл"""
+    if not avatar or not avatar.startswith('static/avatars/'):
+        return
+    match = CONTENT_NAME.match(avatar)
+    paths = [variant_path(match.group(1), size) for size in AVATAR_SIZES] if match else [avatar]
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.exception("Error removing avatar", extra={'path': path})
+
+
+def collect_avatar(avatar):
+    """В фоне удаляет прежний аватар, если на него больше никто не ссылается.
+
+    Вызывать после коммита новой ссылки. Проверка и удаление идут под
+    блокировкой записи базы, а загрузивший тот же файл после своего
+    коммита вызывает ensure_avatar и восстанавливает удалённое.
+    """
+    def collect():
+        try:
+            collect_unused_avatar(avatar, remove_avatar)
+        except Exception:
+            logger.exception("Error collecting avatar", extra={'avatar': avatar})
+        finally:
+            release_connection()
+
+    _executor.submit(collect)
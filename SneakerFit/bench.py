@@ -0,0 +1,218 @@
+"""Бенчмарки горячих путей подбора.
+
+Каталог (в формате base_of_shoes.json) и пользователи генерируются
+синтетически с фиксированным seed. Для каждого размера каталога
+измеряются:
+  scalar    — calculate_compatibility для одного размера;
+  recommend — полный подбор для /get_recommendations без кеша;
+  cached    — find_best_matches через кеш по меркам (пользователи повторяются);
+  detail    — size_compatibility, таблица размеров страницы модели;
+  nearest   — nearest_sizes, лучшие размеры по всему каталогу.
+
+Запуск:
+  python bench.py                       — замер и сравнение с bench_baseline.json
+  python bench.py --save                — записать результаты как новый baseline
+  python bench.py --models 10,1000 --threshold 0.3
+
+Если ops/sec какого-то замера упал больше чем на threshold
+относительно baseline, скрипт завершается с кодом 1. С флагом --ci
+(или при заданной переменной окружения CI) код 1 будет и тогда, когда
+baseline нет или в нём нет какого-то замера, — иначе сравнение молча
+ничего не проверяет.
+
+Перцентили считаются по времени каждого отдельного вызова.
+
+Эталон — bench_baseline.json в репозитории: сравнение в CI идёт с ним.
+Числа зависят от машины, поэтому эталон снимается (--save) на той же
+конфигурации, где работает CI, и коммитится вместе с изменением,
+которое намеренно меняет скорость.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from catalog import CatalogSnapshot
+from recommendations import compute_matches, find_best_matches, recommendation_cards, size_compatibility
+from scoring import calculate_compatibility
+from size_index import nearest_sizes
+
+BASELINE_FILE = 'bench_baseline.json'
+CATALOG_SIZES = (10, 1000, 10000)
+USERS = 200
+THRESHOLD = 0.2
+# Каждый замер идёт не меньше этого времени
+MIN_SECONDS = 1.0
+
+BRANDS = ('Nike', 'Adidas', 'Puma', 'New Balance', 'Asics', 'Reebok', 'Jordan', 'Under Armour')
+FOOT_TYPES = ('Нормальная', 'Плоскостопие', 'Супинация')
+EU_SIZES = (35, 35.5, 36, 37, 37.5, 38, 38.5, 39, 40, 40.5, 41, 42, 42.5, 43, 44, 44.5, 45, 46, 47)
+
+
+def synthetic_catalog(models, seed=1):
+    """Каталог из models моделей с правдоподобной сеткой размеров"""
+    rng = random.Random(seed)
+    sneakers = []
+    for i in range(models):
+        start = rng.randrange(0, 6)
+        count = rng.randint(8, len(EU_SIZES) - start)
+        base = rng.randint(210, 222)
+        girth = rng.randint(-10, 10)
+        sizes = []
+        for step, eu in enumerate(EU_SIZES[start:start + count]):
+            length = base + 5 * (start + step)
+            sizes.append({
+                'eu': eu,
+                'length': length,
+                'toeCircumference': length + 10 + girth,
+                'midfootCircumference': length + 10 + girth + rng.randint(-3, 3),
+                'ankleCircumference': length + 25 + rng.randint(-5, 5),
+                'obliqueCircumference': length + 95 + rng.randint(-5, 5),
+            })
+        sneakers.append({
+            'model': f"{rng.choice(BRANDS)} Synthetic {i}",
+            'sport': 1 if rng.random() < 0.7 else 0,
+            'sizes': sizes,
+        })
+    return {'sneakers': sneakers}
+
+
+def synthetic_users(count, seed=2):
+    """Пользователи с мерками в сантиметрах; часть полей иногда не заполнена"""
+    rng = random.Random(seed)
+    users = []
+    for _ in range(count):
+        user = {
+            'foot_length': round(rng.uniform(21.5, 30.0), 1),
+            'foot_width': round(rng.uniform(8.5, 12.0), 1),
+            'oblique_circumference': round(rng.uniform(21.0, 30.0), 1),
+            'arch': None,
+            'foot_type': rng.choice(FOOT_TYPES),
+        }
+        for field in ('foot_width', 'oblique_circumference', 'foot_type'):
+            if rng.random() < 0.1:
+                user[field] = None
+        users.append(user)
+    return users
+
+
+def measure(operation, min_seconds=MIN_SECONDS):
+    """Гоняет operation(i) не меньше min_seconds; возвращает ops/sec и перцентили в мкс.
+
+    Каждый вызов замеряется отдельно: перцентили по средним пачек
+    сглаживали бы как раз медленные вызовы, ради которых их смотрят.
+    """
+    clock = time.perf_counter_ns
+    samples = []
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + min_seconds
+    while time.perf_counter() < deadline:
+        # Часы опрашиваются раз в 100 вызовов, а не после каждого
+        for i in range(calls, calls + 100):
+            before = clock()
+            operation(i)
+            samples.append(clock() - before)
+        calls += 100
+    elapsed = time.perf_counter() - started
+
+    per_op = np.array(samples) / 1e3
+    return {
+        'ops_per_sec': round(calls / elapsed, 1),
+        'p50_us': round(float(np.percentile(per_op, 50)), 2),
+        'p95_us': round(float(np.percentile(per_op, 95)), 2),
+        'p99_us': round(float(np.percentile(per_op, 99)), 2),
+        'calls': calls,
+    }
+
+
+def run(catalog_sizes, min_seconds=MIN_SECONDS):
+    users = synthetic_users(USERS)
+    results = {}
+    for models in catalog_sizes:
+        snapshot = CatalogSnapshot(synthetic_catalog(models), version=f'bench-{models}')
+        sneakers = snapshot.sneakers
+        # Первый вызов строит матрицу и индекс — в замеры это не входит
+        find_best_matches(users[0], snapshot)
+        nearest_sizes(users[0], snapshot)
+        # cached меряет попадания: кеш заполняется заранее
+        for user in users:
+            find_best_matches(user, snapshot)
+
+        cases = {
+            'scalar': lambda i: calculate_compatibility(
+                users[i % USERS], sneakers[i % models]['sizes'][0], sneakers[i % models]['sport']),
+            'recommend': lambda i: recommendation_cards(compute_matches(users[i % USERS], snapshot), snapshot),
+            'cached': lambda i: find_best_matches(users[i % USERS], snapshot),
+            'detail': lambda i: size_compatibility(sneakers[i % models], users[i % USERS]),
+            'nearest': lambda i: nearest_sizes(users[i % USERS], snapshot),
+        }
+        for name, operation in cases.items():
+            key = f'{name}@{models}'
+            results[key] = measure(operation, min_seconds)
+            r = results[key]
+            print(f"{key:<18} {r['ops_per_sec']:>12,.1f} ops/s   "
+                  f"p50 {r['p50_us']:>10,.1f} us   p95 {r['p95_us']:>10,.1f} us   p99 {r['p99_us']:>10,.1f} us")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Замеры, где ops/sec упал больше чем на threshold, и замеры, которых нет в baseline"""
+    regressions = []
+    missing = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base:
+            missing.append(key)
+            continue
+        change = result['ops_per_sec'] / base['ops_per_sec'] - 1
+        if change < -threshold:
+            regressions.append((key, base['ops_per_sec'], result['ops_per_sec'], change))
+    return regressions, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки подбора размеров')
+    parser.add_argument('--models', default=','.join(map(str, CATALOG_SIZES)),
+                        help='размеры синтетического каталога через запятую')
+    parser.add_argument('--seconds', type=float, default=MIN_SECONDS, help='длительность одного замера')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='допустимое падение ops/sec, доля (0.2 = 20%%)')
+    parser.add_argument('--save', action='store_true', help='сохранить результаты как baseline')
+    parser.add_argument('--ci', action='store_true', default=bool(os.getenv('CI')),
+                        help='нет baseline или замера в нём — ошибка (по умолчанию, если задана CI)')
+    args = parser.parse_args()
+
+    results = run([int(m) for m in args.models.split(',')], args.seconds)
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"WARNING: no baseline at {args.baseline}, nothing was compared; "
+              f"run with --save to create one", file=sys.stderr)
+        return 1 if args.ci else 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions, missing = compare(results, baseline, args.threshold)
+    for key in missing:
+        print(f"WARNING: {key} is not in {args.baseline}, not compared", file=sys.stderr)
+    for key, before, after, change in regressions:
+        print(f"REGRESSION {key}: {before:,.1f} -> {after:,.1f} ops/s ({change:+.0%})")
+    if regressions or (missing and args.ci):
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Сборка статики с хешем содержимого в имени.
+
+Файлы style.css, css/*.css и js/*.js копируются в static/dist/ как
+<имя>.<sha256[:12]>.<расширение>, рядом кладутся сжатые копии .gz и
+.br (если установлен пакет brotli), а соответствие имён записывается
+в static/dist/manifest.json.
+
+Запуск: python build_assets.py
+"""
+import gzip
+import hashlib
+import json
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = 'static'
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+ASSETS_MANIFEST_FILE = os.path.join(DIST_DIR, 'manifest.json')
+SOURCES = ['style.css', 'css', 'js']
+EXTENSIONS = ('.css', '.js')
+
+
+def _sources():
+    for source in SOURCES:
+        path = os.path.join(STATIC_DIR, source)
+        if os.path.isfile(path):
+            yield source
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(EXTENSIONS):
+                    yield f"{source}/{name}"
+
+
+def _write(path, data):
+    if os.path.exists(path):
+        return
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build_asset(filename):
+    with open(os.path.join(STATIC_DIR, filename), 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem, ext = os.path.splitext(filename)
+    built = f"{stem}.{digest}{ext}"
+    path = os.path.join(DIST_DIR, built)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    _write(path, data)
+    # mtime=0, чтобы одинаковый файл всегда давал одинаковый .gz
+    _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(path + '.br', brotli.compress(data, quality=11))
+    return f"dist/{built}"
+
+
+def build_assets():
+    manifest = {filename: build_asset(filename) for filename in _sources()}
+    tmp_path = ASSETS_MANIFEST_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, ASSETS_MANIFEST_FILE)
+    return manifest
+
+
+if __name__ == '__main__':
+    manifest = build_assets()
+    print(f"{len(manifest)} assets written to {DIST_DIR}" + ('' if brotli else ' (brotli not installed, .gz only)'))
@@ -0,0 +1,108 @@
+"""Сборка адаптивных вариантов фотографий моделей.
+
+Для каждой фотографии static/models photo/<модель>/<n>.jpg создаются
+уменьшенные копии в WebP и JPEG с хешем содержимого в имени и
+манифест static/photo_variants/manifest.json.
+
+Запуск: python build_photos.py
+"""
+import hashlib
+import io
+import json
+import os
+import re
+
+from PIL import Image, ImageOps
+
+PHOTOS_DIR = os.path.join('static', 'models photo')
+VARIANTS_DIR = os.path.join('static', 'photo_variants')
+MANIFEST_FILE = os.path.join(VARIANTS_DIR, 'manifest.json')
+
+# Имя варианта -> ширина в пикселях (не больше оригинала)
+VARIANTS = {
+    'thumb': 160,
+    'card': 400,
+    'full': 1200,
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def _encode(image, fmt):
+    pil_format, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def _write_variant(model, index, name, data, fmt):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    model_dir = os.path.join(VARIANTS_DIR, model)
+    os.makedirs(model_dir, exist_ok=True)
+    filename = f"{index}-{name}.{digest}.{'jpg' if fmt == 'jpeg' else fmt}"
+    path = os.path.join(model_dir, filename)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    return f"photo_variants/{model}/{filename}"
+
+
+def photo_files(model_dir):
+    """Фотографии папки модели: {номер: имя файла} в порядке номеров.
+
+    Если у номера несколько файлов (1.jpg и 1.JPEG), берётся первый
+    по имени — так же выбирает photos.PhotoDirectoryIndex.
+    """
+    files = {}
+    for name in sorted(os.listdir(model_dir)):
+        if re.fullmatch(r'\d+\.jpe?g', name, re.IGNORECASE):
+            files.setdefault(int(os.path.splitext(name)[0]), name)
+    return dict(sorted(files.items()))
+
+
+def build_photo(model, filename):
+    index = int(os.path.splitext(filename)[0])
+    with Image.open(os.path.join(PHOTOS_DIR, model, filename)) as original:
+        original = ImageOps.exif_transpose(original).convert('RGB')
+        entry = {
+            'index': index,
+            'original': f"models photo/{model}/{filename}",
+            'width': original.width,
+            'height': original.height,
+            'variants': {},
+        }
+        for name, width in VARIANTS.items():
+            width = min(width, original.width)
+            height = round(original.height * width / original.width)
+            resized = original.resize((width, height), Image.LANCZOS)
+            entry['variants'][name] = {
+                'width': width,
+                'height': height,
+                **{fmt: _write_variant(model, index, name, _encode(resized, fmt), fmt) for fmt in FORMATS},
+            }
+    return entry
+
+
+def build_manifest():
+    manifest = {'models': {}}
+    for model in sorted(os.listdir(PHOTOS_DIR)):
+        model_dir = os.path.join(PHOTOS_DIR, model)
+        if not os.path.isdir(model_dir):
+            continue
+        photos = list(photo_files(model_dir).values())
+        manifest['models'][model] = [build_photo(model, f) for f in photos]
+        print(f"{model}: {len(photos)} photos")
+
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    tmp_path = MANIFEST_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, MANIFEST_FILE)
+    return manifest
+
+
+if __name__ == '__main__':
+    build_manifest()
+    print(f"Manifest written to {MANIFEST_FILE}")
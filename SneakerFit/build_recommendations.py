@@ -0,0 +1,102 @@
+"""Пересчёт таблицы recommendations для всех пользователей.
+
+Пользователи делятся на диапазоны id, каждый диапазон считают
+процессы пула, а записывает результат один основной процесс —
+по транзакции на диапазон. Подборки, которые пользователь обновил
+сам, пока шёл пересчёт, не перезаписываются.
+
+Запуск: python build_recommendations.py [--workers N] [--stale]
+  --stale — только пользователи без подборки или с подборкой для
+            другой версии каталога
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog import get_catalog
+from database import DB_FILE, get_connection, release_connection, setup_db
+from recommendations import rank_matches, store_matches
+
+logger = logging.getLogger(__name__)
+
+CHUNK_USERS = 2000
+
+
+def _rank_chunk(db_path, low, high, catalog_sha256):
+    """Подборки пользователей с id в [low, high); catalog_sha256 — пропустить уже посчитанных"""
+    snapshot = get_catalog()
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(
+            "SELECT u.id, u.foot_length, u.foot_width, u.arch, u.foot_type FROM users u "
+            "LEFT JOIN recommendation_state st ON st.user_id = u.id "
+            "WHERE u.id >= ? AND u.id < ? AND (? IS NULL OR st.catalog_sha256 IS NOT ?)",
+            (low, high, catalog_sha256, catalog_sha256)
+        ).fetchall()
+    finally:
+        conn.close()
+    return snapshot.sha256, [(row['id'], rank_matches(dict(row), snapshot)) for row in rows]
+
+
+def _store_chunk(conn, catalog_sha256, results, started):
+    if not results or catalog_sha256 is None:
+        return 0
+    conn.execute("BEGIN IMMEDIATE")
+    placeholders = ', '.join('?' * len(results))
+    # Пользователь мог сменить мерки во время пересчёта — его подборка свежее нашей
+    updated = {row['user_id'] for row in conn.execute(
+        f"SELECT user_id FROM recommendation_state WHERE user_id IN ({placeholders}) AND updated_at >= ?",
+        [user_id for user_id, _ in results] + [started]
+    )}
+    stored = 0
+    for user_id, matches in results:
+        if user_id not in updated:
+            store_matches(conn, user_id, matches, catalog_sha256)
+            stored += 1
+    conn.commit()
+    return stored
+
+
+def rebuild(workers=None, stale_only=False, db_file=DB_FILE):
+    """Пересчитывает подборки; возвращает число записанных пользователей"""
+    started = time.time()
+    db_path = os.path.abspath(db_file)
+    conn = get_connection()
+    try:
+        low, high = conn.execute("SELECT MIN(id), MAX(id) FROM users").fetchone()
+        if low is None:
+            return 0
+        ranges = [(start, start + CHUNK_USERS) for start in range(low, high + 1, CHUNK_USERS)]
+        only_other_than = get_catalog().sha256 if stale_only else None
+
+        stored = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_rank_chunk, db_path, start, end, only_other_than)
+                       for start, end in ranges]
+            for future in futures:
+                catalog_sha256, results = future.result()
+                stored += _store_chunk(conn, catalog_sha256, results, started)
+        return stored
+    finally:
+        release_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пересчёт таблицы recommendations')
+    parser.add_argument('--workers', type=int, default=None, help='процессов пула (по умолчанию — число ядер)')
+    parser.add_argument('--stale', action='store_true', help='только устаревшие подборки')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    setup_db()
+    started = time.perf_counter()
+    stored = rebuild(args.workers, args.stale)
+    print(f"{stored} users rebuilt in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
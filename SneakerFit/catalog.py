@@ -0,0 +1,291 @@
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = 'base_of_shoes.json'
+
+# Скомпилированный каталог (см. compile_catalog.py):
+#   MAGIC (8 байт) | длина заголовка (uint32 LE) | заголовок JSON
+#   | массивы, каждый с границы ALIGN байт
+# Заголовок: {'format', 'models', 'sizes', 'source_sha256',
+#             'arrays': {имя: [dtype, смещение от начала массивов, форма]}}
+# Кроме столбцов в файле лежат производные индексы матрицы оценки
+# (scoring.INDEX_ARRAYS) — воркеры отображают их в память, а не строят заново.
+COMPILED_CATALOG_FILE = 'base_of_shoes.bin'
+MAGIC = b'SFCATLG\x01'
+FORMAT_VERSION = 2
+ALIGN = 64
+
+# Поле размера в JSON -> имя столбца
+SIZE_FIELDS = {
+    'eu': 'eu',
+    'length': 'length',
+    'toeCircumference': 'toe',
+    'midfootCircumference': 'midfoot',
+    'ankleCircumference': 'ankle',
+    'obliqueCircumference': 'oblique',
+}
+
+# Бренды из нескольких слов, которые нельзя определить по первому слову модели
+MULTI_WORD_BRANDS = ('New Balance', 'Under Armour', 'On Running')
+
+
+def brand_of(shoe):
+    """Определяет бренд модели: поле brand или начало названия"""
+    if shoe.get('brand'):
+        return shoe['brand']
+    model = shoe.get('model', '')
+    for brand in MULTI_WORD_BRANDS:
+        if model.startswith(brand + ' '):
+            return brand
+    return model.split(' ', 1)[0]
+
+
+def aligned(position):
+    return (position + ALIGN - 1) // ALIGN * ALIGN
+
+
+def data_start(header_length):
+    """Начало массивов: сразу за заголовком, с границы ALIGN"""
+    return aligned(len(MAGIC) + 4 + header_length)
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def _check_number(value, where):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise CatalogError(f"{where}: ожидалось число, получено {value!r}")
+    if not math.isfinite(value) or value <= 0:
+        raise CatalogError(f"{where}: недопустимое значение {value!r}")
+
+
+def validate(data):
+    """Проверяет структуру каталога; при ошибке — CatalogError с местом ошибки"""
+    if not isinstance(data, dict) or not isinstance(data.get('sneakers'), list):
+        raise CatalogError("Ожидался объект с массивом 'sneakers'")
+    seen = set()
+    for i, shoe in enumerate(data['sneakers']):
+        where = f"sneakers[{i}]"
+        model = shoe.get('model') if isinstance(shoe, dict) else None
+        if not isinstance(model, str) or not model.strip():
+            raise CatalogError(f"{where}: нет названия модели")
+        if model in seen:
+            raise CatalogError(f"{where}: модель {model!r} встречается дважды")
+        seen.add(model)
+        if shoe.get('sport', 1) not in (0, 1):
+            raise CatalogError(f"{where}: sport должен быть 0 или 1")
+        sizes = shoe.get('sizes')
+        if not isinstance(sizes, list) or not sizes:
+            raise CatalogError(f"{where}: нет размеров")
+        for j, size in enumerate(sizes):
+            for field in SIZE_FIELDS:
+                if field not in size:
+                    raise CatalogError(f"{where}.sizes[{j}]: нет поля {field}")
+                _check_number(size[field], f"{where}.sizes[{j}].{field}")
+
+
+class CompiledCatalog:
+    """Скомпилированный каталог, отображённый в память.
+
+    Столбцы — массивы NumPy прямо поверх mmap: данные не копируются,
+    и все процессы, открывшие файл, делят одни страницы page cache.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a compiled catalog")
+        (header_length,) = struct.unpack_from('<I', self._mmap, len(MAGIC))
+        self.header = json.loads(self._mmap[len(MAGIC) + 4:len(MAGIC) + 4 + header_length])
+        if self.header.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled catalog format: {self.header.get('format')}")
+
+        start = data_start(header_length)
+        for name, (dtype, offset, shape) in self.header['arrays'].items():
+            array = np.frombuffer(self._mmap, dtype=dtype, count=math.prod(shape), offset=start + offset)
+            setattr(self, name, array.reshape(shape))
+
+        names = self.names.tobytes()
+        bounds = self.name_offsets.tolist()
+        self.models = [names[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(len(bounds) - 1)]
+
+    def sizes(self, index):
+        """Размеры модели в виде словарей, как в base_of_shoes.json"""
+        lo, hi = int(self.offsets[index]), int(self.offsets[index + 1])
+        masks = self.float_mask[lo:hi].tolist()
+        columns = [(field, bit, getattr(self, column)[lo:hi].tolist())
+                   for bit, (field, column) in enumerate(SIZE_FIELDS.items())]
+        return [
+            {field: values[row] if masks[row] >> bit & 1 else int(values[row])
+             for field, bit, values in columns}
+            for row in range(hi - lo)
+        ]
+
+    def shoes(self):
+        return [CompiledShoe(self, index) for index in range(len(self.models))]
+
+
+class CompiledShoe(Mapping):
+    """Модель скомпилированного каталога с интерфейсом словаря из JSON"""
+
+    __slots__ = ('_catalog', '_index', '_sizes')
+    KEYS = ('model', 'sport', 'sizes')
+
+    def __init__(self, catalog, index):
+        self._catalog = catalog
+        self._index = index
+        self._sizes = None
+
+    def __getitem__(self, key):
+        if key == 'model':
+            return self._catalog.models[self._index]
+        if key == 'sport':
+            return int(self._catalog.sport[self._index])
+        if key == 'sizes':
+            # Словари размеров собираются при первом обращении и живут вместе со снимком
+            if self._sizes is None:
+                self._sizes = self._catalog.sizes(self._index)
+            return self._sizes
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога с индексами.
+
+    Снимок собирается целиком до публикации, поэтому читатели
+    никогда не видят наполовину загруженный каталог.
+    """
+
+    def __init__(self, data, version=None, columns=None, sha256=None):
+        self.data = data
+        self.version = version
+        # Хеш исходного JSON: один и тот же во всех процессах
+        self.sha256 = sha256
+        # Столбцы скомпилированного каталога, если снимок загружен из него
+        self.columns = columns
+        self.sneakers = data.get('sneakers', [])
+        self.by_model = {}
+        self.by_brand = {}
+        self.by_sport = {}
+        self._derived = {}
+        for shoe in self.sneakers:
+            self.by_model[shoe['model']] = shoe
+            self.by_brand.setdefault(brand_of(shoe), []).append(shoe)
+            self.by_sport.setdefault(shoe.get('sport', 1), []).append(shoe)
+
+    def get_shoe(self, model_name):
+        return self.by_model.get(model_name)
+
+    def derived(self, name, build):
+        """Возвращает производную структуру, построенную один раз на снимок"""
+        value = self._derived.get(name)
+        if value is None:
+            value = self._derived[name] = build(self)
+        return value
+
+    def __len__(self):
+        return len(self.sneakers)
+
+
+class CatalogStore:
+    """Каталог обуви на весь процесс.
+
+    Файл разбирается один раз и перечитывается только при изменении
+    его mtime или размера. Если рядом лежит скомпилированный каталог,
+    собранный из того же JSON, читается он.
+    """
+
+    def __init__(self, path=CATALOG_FILE, compiled_path=COMPILED_CATALOG_FILE):
+        self.path = path
+        self.compiled_path = compiled_path
+        self._lock = threading.Lock()
+        self._snapshot = CatalogSnapshot({"sneakers": []})
+        self._stamp = None
+        self.reload_count = 0
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _file_stamp(self):
+        stamps = (self._stat(self.path), self._stat(self.compiled_path))
+        return stamps if any(stamps) else None
+
+    def snapshot(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return self._snapshot
+        with self._lock:
+            # Другой поток мог уже перечитать файл, пока мы ждали блокировку
+            if stamp != self._stamp:
+                self._reload(stamp)
+        return self._snapshot
+
+    def _reload(self, stamp):
+        try:
+            snapshot = self._load_compiled(stamp) or self._load_json(stamp)
+        except Exception:
+            logger.exception("Error loading catalog")
+            # Битый файл: оставляем прежний снимок до следующего изменения
+            self._stamp = stamp
+            return
+        self._snapshot = snapshot
+        self._stamp = stamp
+        self.reload_count += 1
+
+    def _load_json(self, stamp):
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        data = json.loads(raw)
+        # Те же проверки, что при компиляции: дубль названия ломает by_model и таблицу models
+        validate(data)
+        return CatalogSnapshot(data, version=stamp, sha256=hashlib.sha256(raw).hexdigest())
+
+    def _load_compiled(self, stamp):
+        """Снимок из скомпилированного каталога или None, если его нет или он устарел"""
+        if stamp[1] is None:
+            return None
+        try:
+            compiled = CompiledCatalog(self.compiled_path)
+        except Exception:
+            logger.exception("Error loading compiled catalog, falling back to JSON")
+            return None
+        if stamp[0] is not None:
+            with open(self.path, 'rb') as f:
+                source_sha256 = hashlib.sha256(f.read()).hexdigest()
+            if compiled.header.get('source_sha256') != source_sha256:
+                logger.warning("Compiled catalog is stale, falling back to JSON",
+                               extra={'path': self.compiled_path})
+                return None
+        return CatalogSnapshot({'sneakers': compiled.shoes()}, version=stamp, columns=compiled,
+                               sha256=compiled.header.get('source_sha256'))
+
+
+catalog = CatalogStore()
+
+
+def get_catalog():
+    return catalog.snapshot()
@@ -0,0 +1,188 @@
+"""Каталог в SQLite: таблицы models и sizes с индексами.
+
+Таблицы повторяют текущий снимок каталога. Когда снимок меняется,
+хеш base_of_shoes.json сравнивается с записанным при импорте, и при
+расхождении таблицы перезаполняются одной транзакцией. Если импорт
+не удался, до следующей попытки проходит SYNC_RETRY_SECONDS, а запросы
+читают прежние таблицы.
+
+Импорт вручную: python catalog_db.py
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from catalog import CATALOG_FILE, brand_of, get_catalog
+from database import get_connection, release_connection, setup_db
+
+logger = logging.getLogger(__name__)
+
+# Поле размера в JSON -> столбец таблицы sizes
+SIZE_COLUMNS = {
+    'eu': 'eu',
+    'length': 'length',
+    'toeCircumference': 'toe_circumference',
+    'midfootCircumference': 'midfoot_circumference',
+    'ankleCircumference': 'ankle_circumference',
+    'obliqueCircumference': 'oblique_circumference',
+}
+SIZE_SELECT = ', '.join(f's.{column}' for column in SIZE_COLUMNS.values())
+MAX_SIZES_LIMIT = 1000
+SYNC_RETRY_SECONDS = 60
+
+_sync_lock = threading.Lock()
+_synced_version = None
+# (версия снимка, когда повторить) после неудачного импорта
+_failed_sync = None
+
+
+def source_sha256(path=CATALOG_FILE):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def import_catalog(conn, sneakers, sha256=None):
+    """Перезаполняет models и sizes; вызывается внутри транзакции"""
+    conn.execute("DELETE FROM sizes")
+    conn.execute("DELETE FROM models")
+    for shoe in sneakers:
+        cursor = conn.execute(
+            "INSERT INTO models (name, brand, sport) VALUES (?, ?, ?)",
+            (shoe['model'], brand_of(shoe), shoe.get('sport', 1))
+        )
+        model_id = cursor.lastrowid
+        conn.executemany(
+            f"INSERT INTO sizes (model_id, position, {', '.join(SIZE_COLUMNS.values())}) "
+            f"VALUES (?, ?, {', '.join('?' * len(SIZE_COLUMNS))})",
+            [(model_id, position, *(size[field] for field in SIZE_COLUMNS))
+             for position, size in enumerate(shoe['sizes'])]
+        )
+    conn.execute(
+        "INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('source_sha256', ?)", (sha256,)
+    )
+
+
+def _retry_pending(version):
+    return (_failed_sync is not None and _failed_sync[0] == version
+            and time.monotonic() < _failed_sync[1])
+
+
+def sync_catalog():
+    """Приводит таблицы к текущему снимку каталога, если он сменился"""
+    global _synced_version, _failed_sync
+    snapshot = get_catalog()
+    if snapshot.version == _synced_version or _retry_pending(snapshot.version):
+        return
+    with _sync_lock:
+        if snapshot.version == _synced_version or _retry_pending(snapshot.version):
+            return
+        sha256 = snapshot.sha256 or source_sha256()
+        conn = get_connection()
+        try:
+            # IMMEDIATE: импортирует один воркер, остальные дождутся и увидят новый хеш
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'source_sha256'").fetchone()
+            if row is None or row['value'] != sha256:
+                import_catalog(conn, snapshot.sneakers, sha256)
+                logger.info("Catalog imported into SQLite", extra={'models': len(snapshot)})
+            conn.commit()
+        except Exception:
+            # Не повторяем импорт на каждом запросе: до повтора отдаём прежние таблицы
+            logger.exception("Error importing catalog into SQLite", extra={'retry_in': SYNC_RETRY_SECONDS})
+            _failed_sync = (snapshot.version, time.monotonic() + SYNC_RETRY_SECONDS)
+            conn.rollback()
+            return
+        _synced_version = snapshot.version
+        _failed_sync = None
+
+
+def mirror_version():
+    """Хеш каталога, из которого заполнены таблицы.
+
+    Таблицы может перезаполнить другой воркер без смены снимка в этом
+    процессе, поэтому кеши данных из них ключуются этим хешем. Читать
+    до самих данных: импорт между чтениями лишь сбросит кеш.
+    """
+    sync_catalog()
+    row = get_connection().execute("SELECT value FROM catalog_meta WHERE key = 'source_sha256'").fetchone()
+    return row['value'] if row else None
+
+
+def _size_dict(row):
+    return {field: row[column] for field, column in SIZE_COLUMNS.items()}
+
+
+def get_shoe(model_name):
+    """Модель с размерами по точному названию или None, если такой нет.
+
+    Ошибки базы не глотаются: сбой — это 500, а не «модель не найдена».
+    """
+    sync_catalog()
+    conn = get_connection()
+    model = conn.execute(
+        "SELECT id, name, sport FROM models WHERE name = ?", (model_name,)
+    ).fetchone()
+    if model is None:
+        return None
+    rows = conn.execute(
+        f"SELECT {SIZE_SELECT} FROM sizes s WHERE s.model_id = ? ORDER BY s.position",
+        (model['id'],)
+    ).fetchall()
+    return {'model': model['name'], 'sport': model['sport'], 'sizes': [_size_dict(r) for r in rows]}
+
+
+def get_shoe_sports(model_names):
+    """Признак sport для нескольких моделей одним запросом: {название: sport}"""
+    if not model_names:
+        return {}
+    sync_catalog()
+    conn = get_connection()
+    placeholders = ', '.join('?' * len(model_names))
+    rows = conn.execute(
+        f"SELECT name, sport FROM models WHERE name IN ({placeholders})", list(model_names)
+    ).fetchall()
+    return {row['name']: row['sport'] for row in rows}
+
+
+def find_sizes(length_min=None, length_max=None, eu=None, sport=None, limit=100):
+    """Размеры по диапазону длины (мм), размеру EU и типу обуви.
+
+    Диапазон длины и EU ищутся по индексам idx_sizes_length и idx_sizes_eu.
+    """
+    conditions = []
+    params = []
+    if length_min is not None:
+        conditions.append("s.length >= ?")
+        params.append(length_min)
+    if length_max is not None:
+        conditions.append("s.length <= ?")
+        params.append(length_max)
+    if eu is not None:
+        conditions.append("s.eu = ?")
+        params.append(eu)
+    if sport is not None:
+        conditions.append("m.sport = ?")
+        params.append(sport)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(min(limit, MAX_SIZES_LIMIT))
+    sync_catalog()
+    conn = get_connection()
+    rows = conn.execute(
+        f"SELECT m.name, m.sport, {SIZE_SELECT} FROM sizes s "
+        f"JOIN models m ON m.id = s.model_id {where} "
+        f"ORDER BY s.length, m.name LIMIT ?",
+        params
+    ).fetchall()
+    return [{'model': row['name'], 'sport': row['sport'], 'size': _size_dict(row)} for row in rows]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    setup_db()
+    sync_catalog()
+    release_connection()
+    print(f"{len(get_catalog())} models in SQLite catalog")
@@ -0,0 +1,273 @@
+import datetime
+import heapq
+import json
+import logging
+import threading
+import time
+
+from database import get_connection, release_connection
+
+logger = logging.getLogger(__name__)
+
+# Код действителен 15 минут с момента отправки
+CODE_TTL = 900
+SWEEP_INTERVAL = 60
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _decode(obj):
+    if set(obj) == {'$dt'}:
+        return datetime.datetime.fromisoformat(obj['$dt'])
+    return obj
+
+
+# Счётчики хранятся отдельно от данных кода и меняются только атомарно
+COUNTER_FIELDS = ('attempts', 'used')
+
+
+def _expires_at(data, ttl):
+    issued = data.get('timestamp')
+    return (issued.timestamp() if issued else time.time()) + ttl
+
+
+class MemoryCodeStore:
+    """Коды в памяти процесса с индексом по времени истечения"""
+
+    def __init__(self, kind, ttl=CODE_TTL):
+        self.kind = kind
+        self.ttl = ttl
+        self._entries = {}
+        self._expiry = []  # куча (время истечения, email)
+        self._lock = threading.Lock()
+
+    def get(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry[0] <= time.time():
+                return None
+            return dict(entry[1])
+
+    def put(self, email, data):
+        expires_at = _expires_at(data, self.ttl)
+        with self._lock:
+            self._entries[email] = (expires_at, dict(data))
+            heapq.heappush(self._expiry, (expires_at, email))
+
+    def update(self, email, **fields):
+        """Меняет поля данных кода, не трогая счётчики"""
+        fields = {k: v for k, v in fields.items() if k not in COUNTER_FIELDS}
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None:
+                entry[1].update(fields)
+
+    def register_attempt(self, email, limit):
+        """Засчитывает попытку ввода; номер попытки или None, если кода нет или лимит исчерпан"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry[0] <= time.time() or entry[1].get('attempts', 0) >= limit:
+                return None
+            entry[1]['attempts'] = entry[1].get('attempts', 0) + 1
+            return entry[1]['attempts']
+
+    def mark_used(self, email):
+        """Помечает код подтверждённым; False, если его нет или он уже подтверждён"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry[0] <= time.time() or entry[1].get('used'):
+                return False
+            entry[1]['used'] = True
+            return True
+
+    def take_used(self, email):
+        """Удаляет подтверждённый код; True, если такой код был"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry[0] <= time.time() or not entry[1].get('used'):
+                return False
+            del self._entries[email]
+            return True
+
+    def delete(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def sweep(self):
+        """Удаляет истекшие коды; возвращает их количество"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, email = heapq.heappop(self._expiry)
+                entry = self._entries.get(email)
+                # В куче могут остаться записи о перезаписанных кодах
+                if entry is not None and entry[0] == expires_at:
+                    del self._entries[email]
+                    removed += 1
+        return removed
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteCodeStore:
+    """Коды в таблице pending_codes: их видят все воркеры приложения"""
+
+    def __init__(self, kind, ttl=CODE_TTL):
+        self.kind = kind
+        self.ttl = ttl
+
+    def get(self, email):
+        row = get_connection().execute(
+            "SELECT data, attempts, used FROM pending_codes WHERE kind = ? AND email = ? AND expires_at > ?",
+            (self.kind, email, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row['data'], object_hook=_decode)
+        data['attempts'] = row['attempts']
+        data['used'] = bool(row['used'])
+        return data
+
+    def put(self, email, data):
+        """Новый код: счётчики берутся из data (обычно нули)"""
+        blob = {k: v for k, v in data.items() if k not in COUNTER_FIELDS}
+        conn = get_connection()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO pending_codes (kind, email, data, expires_at, attempts, used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.kind, email, json.dumps(blob, default=_encode), _expires_at(data, self.ttl),
+                 data.get('attempts', 0), int(bool(data.get('used'))))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def update(self, email, **fields):
+        """Меняет поля данных кода, не трогая счётчики"""
+        fields = {k: v for k, v in fields.items() if k not in COUNTER_FIELDS}
+        conn = get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT data FROM pending_codes WHERE kind = ? AND email = ?", (self.kind, email)
+            ).fetchone()
+            if row is not None:
+                data = json.loads(row['data'], object_hook=_decode)
+                data.update(fields)
+                conn.execute(
+                    "UPDATE pending_codes SET data = ? WHERE kind = ? AND email = ?",
+                    (json.dumps(data, default=_encode), self.kind, email)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def register_attempt(self, email, limit):
+        """Засчитывает попытку ввода; номер попытки или None, если кода нет или лимит исчерпан"""
+        conn = get_connection()
+        try:
+            row = conn.execute(
+                "UPDATE pending_codes SET attempts = attempts + 1 "
+                "WHERE kind = ? AND email = ? AND expires_at > ? AND attempts < ? RETURNING attempts",
+                (self.kind, email, time.time(), limit)
+            ).fetchone()
+            conn.commit()
+            return row['attempts'] if row else None
+        except Exception:
+            conn.rollback()
+            raise
+
+    def mark_used(self, email):
+        """Помечает код подтверждённым; False, если его нет или он уже подтверждён"""
+        conn = get_connection()
+        try:
+            cursor = conn.execute(
+                "UPDATE pending_codes SET used = 1 WHERE kind = ? AND email = ? AND expires_at > ? AND used = 0",
+                (self.kind, email, time.time())
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+        except Exception:
+            conn.rollback()
+            raise
+
+    def take_used(self, email):
+        """Удаляет подтверждённый код; True, если такой код был"""
+        conn = get_connection()
+        try:
+            cursor = conn.execute(
+                "DELETE FROM pending_codes WHERE kind = ? AND email = ? AND expires_at > ? AND used = 1",
+                (self.kind, email, time.time())
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+        except Exception:
+            conn.rollback()
+            raise
+
+    def delete(self, email):
+        conn = get_connection()
+        try:
+            conn.execute("DELETE FROM pending_codes WHERE kind = ? AND email = ?", (self.kind, email))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def sweep(self):
+        conn = get_connection()
+        try:
+            cursor = conn.execute(
+                "DELETE FROM pending_codes WHERE kind = ? AND expires_at <= ?",
+                (self.kind, time.time())
+            )
+            conn.commit()
+            return cursor.rowcount
+        except Exception:
+            conn.rollback()
+            raise
+
+    def __len__(self):
+        row = get_connection().execute(
+            "SELECT COUNT(*) AS n FROM pending_codes WHERE kind = ? AND expires_at > ?",
+            (self.kind, time.time())
+        ).fetchone()
+        return row['n']
+
+
+BACKENDS = {
+    'memory': MemoryCodeStore,
+    'sqlite': SqliteCodeStore,
+}
+
+
+def create_store(kind, backend='sqlite', ttl=CODE_TTL):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown code store backend: {backend}")
+    return BACKENDS[backend](kind, ttl=ttl)
+
+
+def start_sweeper(stores, interval=SWEEP_INTERVAL):
+    """Фоновый поток, периодически удаляющий истекшие коды"""
+    def run():
+        while True:
+            time.sleep(interval)
+            for store in stores:
+                try:
+                    store.sweep()
+                except Exception:
+                    logger.exception("Error sweeping expired codes")
+            release_connection()
+
+    thread = threading.Thread(target=run, name='code-sweeper', daemon=True)
+    thread.start()
+    return thread
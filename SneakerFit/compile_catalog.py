@@ -0,0 +1,97 @@
+"""Компиляция каталога в колоночный бинарный файл.
+
+base_of_shoes.json проверяется один раз и записывается в
+base_of_shoes.bin: по массиву фиксированной ширины на каждое измерение
+размеров плюс смещения моделей и готовые индексы матрицы оценки.
+Приложение отображает файл в память (mmap) и читает массивы без
+копирования, поэтому все воркеры делят одну копию в page cache.
+
+Формат файла описан в catalog.py.
+
+Запуск: python compile_catalog.py
+"""
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+from catalog import (
+    CATALOG_FILE, COMPILED_CATALOG_FILE, FORMAT_VERSION, MAGIC, SIZE_FIELDS, aligned,
+    data_start, validate
+)
+from scoring import CatalogMatrix
+
+
+def _arrays(data):
+    sneakers = data['sneakers']
+    sizes = [size for shoe in sneakers for size in shoe['sizes']]
+    names = [shoe['model'].encode('utf-8') for shoe in sneakers]
+
+    arrays = {
+        'offsets': np.cumsum([0] + [len(shoe['sizes']) for shoe in sneakers], dtype='<i8'),
+        'sport': np.array([shoe.get('sport', 1) for shoe in sneakers], dtype='i1'),
+        'name_offsets': np.cumsum([0] + [len(name) for name in names], dtype='<i8'),
+        'names': np.frombuffer(b''.join(names), dtype='u1'),
+    }
+    for field, column in SIZE_FIELDS.items():
+        arrays[column] = np.array([size[field] for size in sizes], dtype='<f8')
+    # Бит i — поле i в JSON было дробным: 190.0 должно остаться 190.0, а не 190
+    float_mask = np.zeros(len(sizes), dtype='u1')
+    for bit, field in enumerate(SIZE_FIELDS):
+        float_mask |= np.array([isinstance(size[field], float) for size in sizes], dtype='u1') << bit
+    arrays['float_mask'] = float_mask
+
+    # Индексы, которые иначе каждый воркер строил бы сам при первом запросе
+    matrix = CatalogMatrix(sneakers)
+    arrays.update(matrix.index_arrays())
+    return arrays
+
+
+def compile_catalog(data, source_sha256=None):
+    """Байты скомпилированного каталога"""
+    validate(data)
+    arrays = _arrays(data)
+
+    header = {
+        'format': FORMAT_VERSION,
+        'models': len(data['sneakers']),
+        'sizes': int(arrays['offsets'][-1]),
+        'source_sha256': source_sha256,
+        'arrays': {},
+    }
+    position = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = [array.dtype.str, position, list(array.shape)]
+        position = aligned(position + array.nbytes)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    start = data_start(len(header_bytes))
+    out = bytearray(start + position)
+    out[:len(MAGIC)] = MAGIC
+    out[len(MAGIC):len(MAGIC) + 4] = struct.pack('<I', len(header_bytes))
+    out[len(MAGIC) + 4:len(MAGIC) + 4 + len(header_bytes)] = header_bytes
+    for name, array in arrays.items():
+        offset = start + header['arrays'][name][1]
+        out[offset:offset + array.nbytes] = array.tobytes()
+    return bytes(out)
+
+
+def compile_file(source=CATALOG_FILE, target=COMPILED_CATALOG_FILE):
+    with open(source, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw)
+    compiled = compile_catalog(data, hashlib.sha256(raw).hexdigest())
+    # Новый файл подменяется целиком: уже отображённая в память старая
+    # версия остаётся цела, пока её не отпустят воркеры
+    tmp_path = target + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(compiled)
+    os.replace(tmp_path, target)
+    return len(data['sneakers']), len(compiled)
+
+
+if __name__ == '__main__':
+    models, size = compile_file()
+    print(f"{models} models compiled to {COMPILED_CATALOG_FILE} ({size} bytes)")
@@ -1,34 +1,317 @@
+import logging
 import sqlite3
 import os
+import queue
+import threading
+import time
+
+from metrics import record_query
+
+logger = logging.getLogger(__name__)
 
 DB_FILE = 'users.db'
+POOL_SIZE = 8
+
+# Применяются один раз при открытии соединения
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=67108864",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, который считает запросы и их время для /metrics"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_query(time.perf_counter() - started)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Соединение из пула.
+
+    Соединение одно на поток, поэтому close() ничего не делает: иначе
+    функция, закрывшая «своё» соединение, откатила бы транзакцию
+    вызвавшего её кода. Незавершённую транзакцию откатывает
+    release_connection(), когда поток отдаёт соединение пулу.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def close(self):
+        pass
+
+
+class ConnectionPool:
+    def __init__(self, db_file, size=POOL_SIZE):
+        self.db_file = db_file
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._local = threading.local()
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_file, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        """Соединение текущего потока; в пределах запроса оно одно"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def release(self):
+        """Возвращает соединение текущего потока в пул"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            sqlite3.Connection.close(conn)
+
+    def close_all(self):
+        self.release()
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            sqlite3.Connection.close(conn)
+
+
+pool = ConnectionPool(DB_FILE)
+
 
 def get_connection():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return pool.acquire()
+
+
+def release_connection(exc=None):
+    pool.release()
+
+
+def close_pool():
+    pool.close_all()
+
+
+# ------------------ Миграции схемы ------------------
+
+def _create_users(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            registration_date TEXT,
+            registration_type TEXT,
+            foot_length REAL,
+            foot_width REAL,
+            arch TEXT,
+            oblique_circumference REAL,
+            foot_type TEXT,
+            avatar TEXT,
+            about TEXT DEFAULT '',
+            subscription INTEGER DEFAULT 0,
+            email_verified BOOLEAN DEFAULT FALSE
+        )
+    """)
+
+
+def _add_email_verified(conn):
+    # Старые базы из setup_db создавались без этого столбца
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(users)")}
+    if 'email_verified' not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN email_verified BOOLEAN DEFAULT FALSE")
+
+
+def _index_username(conn):
+    # Повторяющиеся ники получают суффикс с id, первый по id остаётся как есть.
+    # Ник с таким суффиксом может уже быть занят — тогда к нему добавляется счётчик
+    taken = {row['username'] for row in conn.execute("SELECT DISTINCT username FROM users")}
+    duplicates = conn.execute("""
+        SELECT id, username FROM users
+        WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY username)
+        ORDER BY id
+    """).fetchall()
+    for row in duplicates:
+        candidate = f"{row['username']}_{row['id']}"
+        counter = 2
+        while candidate in taken:
+            candidate = f"{row['username']}_{row['id']}_{counter}"
+            counter += 1
+        taken.add(candidate)
+        conn.execute("UPDATE users SET username = ? WHERE id = ?", (candidate, row['id']))
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username)")
+
+
+def _create_pending_codes(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pending_codes (
+            kind TEXT NOT NULL,
+            email TEXT NOT NULL,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (kind, email)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_codes_expires ON pending_codes (kind, expires_at)")
+
+
+def _create_catalog_tables(conn):
+    # Столбцы размеров без типа: SQLite хранит значение как есть,
+    # и 190 из JSON не превращается в 190.0 (и наоборот)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS models (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            brand TEXT NOT NULL,
+            sport INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sizes (
+            id INTEGER PRIMARY KEY,
+            model_id INTEGER NOT NULL REFERENCES models (id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            eu NOT NULL,
+            length NOT NULL,
+            toe_circumference,
+            midfoot_circumference,
+            ankle_circumference,
+            oblique_circumference
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_models_sport ON models (sport)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sizes_model ON sizes (model_id, position)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sizes_eu ON sizes (eu)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sizes_length ON sizes (length)")
+
+
+def _create_recommendations(conn):
+    # Лучшие модели пользователя; размер — номер внутри модели, как в каталоге
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recommendations (
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            rank INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            size_position INTEGER NOT NULL,
+            compatibility NOT NULL,
+            PRIMARY KEY (user_id, rank)
+        ) WITHOUT ROWID
+    """)
+    # Для какого каталога посчитаны строки; пустой список тоже результат
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recommendation_state (
+            user_id INTEGER PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+            catalog_sha256 TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+
+
+def _add_code_counters(conn):
+    # Попытки и подтверждение меняются одним UPDATE, а не через JSON в data
+    conn.execute("ALTER TABLE pending_codes ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE pending_codes ADD COLUMN used INTEGER NOT NULL DEFAULT 0")
+    conn.execute("""
+        UPDATE pending_codes
+        SET attempts = COALESCE(json_extract(data, '$.attempts'), 0),
+            used = COALESCE(json_extract(data, '$.used'), 0)
+    """)
+
+
+def _create_mail_jobs(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS mail_jobs (
+            id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mail_jobs_updated ON mail_jobs (updated_at)")
+
+
+MIGRATIONS = [
+    (1, _create_users),
+    (2, _add_email_verified),
+    (3, _index_username),
+    (4, _create_pending_codes),
+    (5, _create_catalog_tables),
+    (6, _create_recommendations),
+    (7, _add_code_counters),
+    (8, _create_mail_jobs),
+]
+
+
+def schema_version(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    row = conn.execute("SELECT MAX(version) AS version FROM schema_version").fetchone()
+    return row['version'] or 0
+
+
+def migrate(conn):
+    """Применяет недостающие миграции, каждую в своей транзакции"""
+    current = schema_version(conn)
+    for version, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            conn.execute("BEGIN")
+            apply(conn)
+            conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Database migrated", extra={'version': version})
+
 
 def setup_db():
-    if not os.path.exists(DB_FILE):
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                registration_date TEXT,
-                registration_type TEXT,
-                foot_length REAL,
-                foot_width REAL,
-                arch TEXT,
-                oblique_circumference REAL,
-                foot_type TEXT,
-                avatar TEXT,
-                about TEXT, 
-                subscription INTEGER DEFAULT 0
-            )
-        """)
-        conn.commit()
-        conn.close()
+    conn = get_connection()
+    migrate(conn)
+    # Схему создаём до запуска воркеров — не держим открытых соединений
+    close_pool()
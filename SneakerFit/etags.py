@@ -0,0 +1,54 @@
+"""ETag и условные GET-запросы.
+
+ETag считается не из готового тела, а из версий того, от чего ответ
+зависит: каталога, мерок пользователя, шаблона и собранной статики.
+Поэтому, если клиент прислал тот же If-None-Match, ответ 304 отдаётся
+до подбора размеров и рендеринга шаблона.
+"""
+import hashlib
+import os
+
+from flask import Response, current_app, make_response, request
+
+# Сжатый compress_response ответ — другое представление, у него свой ETag
+GZIP_SUFFIX = '-gzip'
+# Браузер хранит ответ, но каждый раз сверяет ETag
+REVALIDATE = 'private, no-cache'
+
+
+def make_etag(*parts):
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def catalog_version(snapshot):
+    """Версия каталога, одинаковая во всех процессах"""
+    return snapshot.sha256 or repr(snapshot.version)
+
+
+def template_version(name):
+    try:
+        st = os.stat(os.path.join(current_app.root_path, current_app.template_folder, name))
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def not_modified(etag):
+    """Ответ 304, если у клиента уже есть ответ с этим ETag, иначе None"""
+    if request.if_none_match.contains(etag):
+        matched = etag
+    elif request.if_none_match.contains(etag + GZIP_SUFFIX):
+        matched = etag + GZIP_SUFFIX
+    else:
+        return None
+    response = Response(status=304)
+    response.set_etag(matched)
+    response.headers['Cache-Control'] = REVALIDATE
+    return response
+
+
+def with_etag(rv, etag):
+    response = make_response(rv)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = REVALIDATE
+    return response
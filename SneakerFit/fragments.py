@@ -0,0 +1,35 @@
+"""Кеш отрендеренных фрагментов страниц.
+
+Блок совместимости размеров на странице модели зависит только от
+модели, мерок и каталога, поэтому у пользователей с одинаковыми
+мерками он побайтно совпадает. Фрагмент рендерится один раз и
+хранится в LRU-кеше, ограниченном по числу записей и по памяти.
+Модель читается из каталога в SQLite, поэтому кеш сбрасывается при
+смене его хеша (catalog_db.mirror_version), а не версии снимка JSON.
+"""
+from flask import render_template
+from markupsafe import Markup
+
+from etags import template_version
+from lru import LRUCache
+from recommendations import size_compatibility, size_measurements_key
+
+SIZE_TABLE_TEMPLATE = 'shoe_sizes.html'
+SIZE_TABLE_CACHE_SIZE = 20000
+SIZE_TABLE_CACHE_BYTES = 32 * 1024 * 1024
+
+size_tables = LRUCache('size_tables', SIZE_TABLE_CACHE_SIZE, max_bytes=SIZE_TABLE_CACHE_BYTES)
+
+
+def size_table(shoe, user, version):
+    """HTML блока совместимости размеров модели для мерок пользователя.
+
+    version — mirror_version(), прочитанная до get_shoe.
+    """
+    size_tables.validate(version)
+    key = (shoe['model'], template_version(SIZE_TABLE_TEMPLATE), *size_measurements_key(user))
+    html = size_tables.get(key)
+    if html is None:
+        html = Markup(render_template(SIZE_TABLE_TEMPLATE, shoe=shoe, sizes=size_compatibility(shoe, user)))
+        size_tables.put(key, html)
+    return html
@@ -0,0 +1,131 @@
+"""Логирование без блокировки рабочих потоков.
+
+Потоки запросов только кладут записи в очередь (QueueHandler), а пишет
+их в stdout отдельный поток QueueListener — по одной JSON-строке на
+запись. Если очередь переполнена, запись отбрасывается, а не ждёт.
+
+Настройка через переменные окружения:
+  LOG_LEVEL          — общий уровень (INFO)
+  LOG_LEVELS         — уровни модулей: "user_service=WARNING,database=DEBUG"
+  LOG_DEBUG_SAMPLE   — доля DEBUG-записей, которые попадают в лог (0.1)
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+LOG_QUEUE_SIZE = 10000
+DEBUG_SAMPLE_RATE = 0.1
+
+# Значения этих полей никогда не попадают в лог
+SENSITIVE_FIELDS = {'password', 'new_password', 'confirm_password', 'code', 'token', 'secret'}
+REDACTED = '***'
+
+# Атрибуты, которые есть у любой LogRecord; остальное — поля из extra
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+_queue_handler = None
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if k in SENSITIVE_FIELDS else _redact(v) for k, v in value.items()}
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна JSON-строка; поля из extra идут верхним уровнем"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(_redact(entry), ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю rate DEBUG-записей; остальные уровни — все"""
+
+    def __init__(self, rate=DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при полной очереди отбрасывает запись"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # В потоке запроса только подставляем аргументы; JSON собирает поток записи
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Подключает очередь к корневому логгеру; повторный вызов ничего не делает"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _queue_handler
+
+    root = logging.getLogger()
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    for name, level in _parse_levels(os.getenv('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(float(os.getenv('LOG_DEBUG_SAMPLE', DEBUG_SAMPLE_RATE))))
+    root.addHandler(_queue_handler)
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _queue_handler
+
+
+def dropped_records():
+    return _queue_handler.dropped if _queue_handler else 0
@@ -0,0 +1,79 @@
+"""Ограниченный LRU-кеш в памяти процесса.
+
+Кеш привязан к версии данных (обычно версии каталога): при смене
+версии он очищается целиком. Размер ограничен числом записей и, если
+задан max_bytes, памятью значений (sys.getsizeof). Попадания, промахи,
+вытеснения и сбросы считаются в sneakerfit_cache_events_total{cache=...}.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from metrics import Counter, register_callback
+
+cache_events = Counter(
+    'sneakerfit_cache_events_total', 'In-process cache hits, misses, evictions and invalidations',
+    ('cache', 'event'))
+
+
+class LRUCache:
+    def __init__(self, name, maxsize, max_bytes=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.version = None
+        self.bytes = 0
+        self._data = OrderedDict()  # ключ -> (значение, байт)
+        self._lock = threading.Lock()
+        register_callback(f'sneakerfit_{name}_cache_entries', f'Entries in the {name} cache', self.__len__)
+        if max_bytes is not None:
+            register_callback(f'sneakerfit_{name}_cache_bytes', f'Bytes held by the {name} cache',
+                              lambda: self.bytes)
+
+    def validate(self, version):
+        """Очищает кеш, если версия данных сменилась"""
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            if self._data:
+                cache_events.inc(self.name, 'invalidation')
+            self._data.clear()
+            self.bytes = 0
+            self.version = version
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                cache_events.inc(self.name, 'miss')
+                return default
+            self._data.move_to_end(key)
+        cache_events.inc(self.name, 'hit')
+        return entry[0]
+
+    def put(self, key, value):
+        size = sys.getsizeof(value) if self.max_bytes is not None else 0
+        evicted = 0
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._data[key] = (value, size)
+            self.bytes += size
+            while self._data and (len(self._data) > self.maxsize
+                                  or (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+                evicted += 1
+        if evicted:
+            cache_events.inc(self.name, 'eviction', amount=evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
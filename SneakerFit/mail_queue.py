@@ -0,0 +1,165 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+import uuid
+
+from database import get_connection, release_connection
+from metrics import smtp_send_latency
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+WORKERS = 2
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 1.0
+# Соединение без писем дольше этого времени закрывается
+IDLE_TIMEOUT = 60
+# Состояние задания хранится час после последнего изменения
+STATUS_TTL = 3600
+STATUS_FIELDS = ('state', 'attempts', 'error')
+
+
+class MailStatusStore:
+    """Состояния заданий в таблице mail_jobs: /mail_status может попасть
+    в любой воркер, а письмо отправляет тот, где его поставили в очередь"""
+
+    def __init__(self, ttl=STATUS_TTL):
+        self.ttl = ttl
+
+    def create(self, job_id):
+        conn = get_connection()
+        try:
+            now = time.time()
+            conn.execute("DELETE FROM mail_jobs WHERE updated_at < ?", (now - self.ttl,))
+            conn.execute(
+                "INSERT INTO mail_jobs (id, state, attempts, error, updated_at) VALUES (?, 'queued', 0, NULL, ?)",
+                (job_id, now)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def update(self, job_id, **fields):
+        columns = [field for field in STATUS_FIELDS if field in fields]
+        conn = get_connection()
+        try:
+            conn.execute(
+                f"UPDATE mail_jobs SET {', '.join(f'{c} = ?' for c in columns)}, updated_at = ? WHERE id = ?",
+                [fields[c] for c in columns] + [time.time(), job_id]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def get(self, job_id):
+        row = get_connection().execute(
+            "SELECT state, attempts, error FROM mail_jobs WHERE id = ? AND updated_at >= ?",
+            (job_id, time.time() - self.ttl)
+        ).fetchone()
+        return dict(row) if row else None
+
+
+class MailQueue:
+    """Очередь писем с фоновой отправкой.
+
+    Каждый рабочий поток держит одно SMTP-соединение и переиспользует
+    его для следующих писем. Неудачная отправка повторяется с
+    экспоненциальной паузой и новым соединением.
+    """
+
+    def __init__(self, app, mail, workers=WORKERS, maxsize=QUEUE_SIZE,
+                 max_attempts=MAX_ATTEMPTS, backoff=BACKOFF_SECONDS, statuses=None):
+        self.app = app
+        self.mail = mail
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._statuses = statuses or MailStatusStore()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'mail-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, message):
+        """Ставит письмо в очередь; возвращает id задания или None, если очередь полна"""
+        self.start()
+        # Случайный id: номера по порядку совпадали бы у разных воркеров
+        job_id = uuid.uuid4().hex
+        self._statuses.create(job_id)
+        try:
+            self._queue.put_nowait((job_id, message))
+        except queue.Full:
+            self._set_status(job_id, state='failed', error='queue is full')
+            return None
+        return job_id
+
+    def status(self, job_id):
+        return self._statuses.get(job_id)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _set_status(self, job_id, **fields):
+        try:
+            self._statuses.update(job_id, **fields)
+        except Exception:
+            # Без состояния письмо всё равно должно уйти
+            logger.exception("Error saving mail job status", extra={'mail_job': job_id})
+
+    def _run(self):
+        connection = None
+        with self.app.app_context():
+            while True:
+                try:
+                    job_id, message = self._queue.get(timeout=IDLE_TIMEOUT)
+                except queue.Empty:
+                    connection = self._disconnect(connection)
+                    continue
+                try:
+                    connection = self._deliver(connection, job_id, message)
+                finally:
+                    # Контекст приложения живёт весь цикл — соединение с базой отдаём сами
+                    release_connection()
+                    self._queue.task_done()
+
+    def _deliver(self, connection, job_id, message):
+        for attempt in range(1, self.max_attempts + 1):
+            self._set_status(job_id, state='sending', attempts=attempt)
+            started = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = self.mail.connect().__enter__()
+                connection.send(message)
+                smtp_send_latency.observe(time.perf_counter() - started, 'sent')
+                self._set_status(job_id, state='sent', error=None)
+                return connection
+            except Exception as e:
+                smtp_send_latency.observe(time.perf_counter() - started, 'error')
+                logger.warning("Email send failed", extra={'mail_job': job_id, 'attempt': attempt, 'error': str(e)})
+                self._set_status(job_id, error=str(e))
+                connection = self._disconnect(connection)
+                if attempt < self.max_attempts:
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+        self._set_status(job_id, state='failed')
+        return connection
+
+    @staticmethod
+    def _disconnect(connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+        return None
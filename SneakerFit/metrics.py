@@ -0,0 +1,186 @@
+"""Метрики приложения в текстовом формате Prometheus.
+
+Счётчики и гистограммы живут в памяти процесса и отдаются на /metrics.
+Обновление — одна блокировка и пара сложений, поэтому их можно
+вызывать на каждом запросе и каждом SQL-запросе.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+SMTP_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # метки -> [счётчики по корзинам (+Inf последней), сумма]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == '+Inf' else f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+class CallbackMetric:
+    """Значение, которое считается в момент чтения /metrics"""
+
+    def __init__(self, name, help, read, kind='gauge'):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+        _registry.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        try:
+            lines.append(f'{self.name} {_format_value(self.read())}')
+        except Exception:
+            logger.exception("Error reading metric", extra={'metric': self.name})
+        return lines
+
+
+def register_callback(name, help, read, kind='gauge'):
+    return CallbackMetric(name, help, read, kind)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ------------------ HTTP ------------------
+
+http_requests = Counter(
+    'sneakerfit_http_requests_total', 'HTTP requests by endpoint, method and status',
+    ('endpoint', 'method', 'status'))
+http_latency = Histogram(
+    'sneakerfit_http_request_duration_seconds', 'HTTP request latency by endpoint', ('endpoint',))
+request_sql_queries = Histogram(
+    'sneakerfit_request_sql_queries', 'SQL queries per HTTP request by endpoint', ('endpoint',),
+    buckets=QUERY_COUNT_BUCKETS)
+request_sql_seconds = Counter(
+    'sneakerfit_request_sql_seconds_total', 'Time spent in SQL by endpoint', ('endpoint',))
+
+
+# ------------------ SQL ------------------
+
+sql_queries = Counter('sneakerfit_sql_queries_total', 'SQL statements executed')
+sql_latency = Histogram('sneakerfit_sql_query_duration_seconds', 'SQL statement latency', buckets=SQL_BUCKETS)
+
+# SQL текущего запроса: поток обслуживает один HTTP-запрос за раз
+_request_sql = threading.local()
+
+
+def record_query(seconds):
+    sql_queries.inc()
+    sql_latency.observe(seconds)
+    if getattr(_request_sql, 'active', False):
+        _request_sql.queries += 1
+        _request_sql.seconds += seconds
+
+
+# ------------------ Почта ------------------
+
+smtp_send_latency = Histogram(
+    'sneakerfit_smtp_send_duration_seconds', 'SMTP send latency by result', ('result',),
+    buckets=SMTP_BUCKETS)
+
+
+# ------------------ Хуки Flask ------------------
+
+def start_request():
+    """before_request: засекает время и обнуляет счётчики SQL"""
+    g.metrics_started = time.perf_counter()
+    _request_sql.active = True
+    _request_sql.queries = 0
+    _request_sql.seconds = 0.0
+
+
+def finish_request(response):
+    """after_request: записывает длительность, статус и SQL запроса"""
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    http_requests.inc(endpoint, request.method, str(response.status_code))
+    http_latency.observe(time.perf_counter() - started, endpoint)
+    request_sql_queries.observe(_request_sql.queries, endpoint)
+    if _request_sql.seconds:
+        request_sql_seconds.inc(endpoint, amount=_request_sql.seconds)
+    _request_sql.active = False
+    return response
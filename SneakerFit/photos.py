@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import threading
+from urllib.parse import quote
+
+from build_photos import MANIFEST_FILE, PHOTOS_DIR, photo_files
+
+logger = logging.getLogger(__name__)
+
+# Файлы с хешем в имени не меняются — их можно кешировать навсегда
+VARIANTS_URL_PREFIX = '/static/photo_variants/'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def static_url(path):
+    return '/static/' + quote(path)
+
+
+class PhotoManifest:
+    """Манифест вариантов фотографий, перечитывается при изменении файла"""
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._models = {}
+        self._stamp = None
+
+    def models(self):
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._models = self._load() if stamp else {}
+                    self._stamp = stamp
+        return self._models
+
+    def version(self):
+        """Отметка файла, из которого загружен манифест"""
+        self.models()
+        return self._stamp
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('models', {})
+        except Exception:
+            logger.exception("Error loading photo manifest")
+            return {}
+
+
+manifest = PhotoManifest()
+
+
+def _srcset(variants, fmt):
+    # Узкий оригинал даёт варианты одной ширины; повтор ширины в srcset недопустим
+    by_width = {}
+    for variant in variants.values():
+        by_width.setdefault(variant['width'], variant)
+    return ', '.join(f"{static_url(v[fmt])} {width}w" for width, v in by_width.items())
+
+
+def photo_sources(photo):
+    """src/srcset одной фотографии из манифеста"""
+    variants = photo['variants']
+    return {
+        'src': static_url(variants['card']['jpeg']),
+        'srcset': _srcset(variants, 'jpeg'),
+        'webpSrcset': _srcset(variants, 'webp'),
+        'full': static_url(variants['full']['jpeg']),
+    }
+
+
+def original_sources(model, filename):
+    """src/srcset исходного файла, когда вариантов в манифесте нет"""
+    original = static_url(f"models photo/{model}/{filename}")
+    return {'src': original, 'srcset': '', 'webpSrcset': '', 'full': original}
+
+
+def model_image(model, index=1):
+    """Картинка модели для карточки; без манифеста — исходный файл"""
+    for photo in manifest.models().get(model, []):
+        if photo['index'] == index:
+            return photo_sources(photo)
+    return original_sources(model, photo_index.files(model).get(index, f"{index}.jpg"))
+
+
+class PhotoDirectoryIndex:
+    """Фотографии каждой модели: номер -> имя файла (1.jpg, 2.JPEG, ...).
+
+    Папка модели сканируется один раз и повторно — только когда
+    меняется её mtime (файлы добавили или удалили).
+    """
+
+    def __init__(self, root=PHOTOS_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._entries = {}  # модель -> (mtime папки, {номер: имя файла})
+
+    def files(self, model):
+        """{номер: имя файла} в порядке номеров"""
+        path = os.path.join(self.root, model)
+        try:
+            stamp = os.stat(path).st_mtime_ns
+        except OSError:
+            return {}
+        entry = self._entries.get(model)
+        if entry is None or entry[0] != stamp:
+            # То же правило, что у build_photos.py: манифест и галерея не расходятся
+            entry = (stamp, photo_files(path))
+            with self._lock:
+                self._entries[model] = entry
+        return entry[1]
+
+
+photo_index = PhotoDirectoryIndex()
+
+
+def model_photos(model):
+    """Все фотографии модели для галереи, в порядке номеров"""
+    variants = {photo['index']: photo for photo in manifest.models().get(model, [])}
+    photos = []
+    for index, filename in photo_index.files(model).items():
+        photo = variants.get(index)
+        if photo:
+            sources = photo_sources(photo)
+            thumb = static_url(photo['variants']['thumb']['jpeg'])
+        else:
+            sources = original_sources(model, filename)
+            thumb = sources['src']
+        photos.append({'index': index, 'thumb': thumb, **sources})
+    return photos
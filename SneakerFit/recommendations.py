@@ -0,0 +1,192 @@
+import logging
+import time
+
+from catalog import get_catalog, brand_of
+from database import get_connection
+from lru import LRUCache
+from metrics import Counter
+from photos import model_image
+from scoring import calculate_compatibility, catalog_matrix, best_sizes
+
+logger = logging.getLogger(__name__)
+
+MIN_COMPATIBILITY = 30
+RECOMMENDATIONS_LIMIT = 8
+MATCHES_CACHE_SIZE = 10000
+
+recommendation_reads = Counter(
+    'sneakerfit_recommendation_reads_total', 'Recommendation reads by source (table or computed)',
+    ('source',))
+# Сбрасывается при смене версии каталога
+matches_cache = LRUCache('matches', MATCHES_CACHE_SIZE)
+
+
+def shoe_type_of(shoe):
+    return 'sport' if shoe.get('sport', 1) == 1 else 'casual'
+
+
+def compute_matches(user, snapshot):
+    """Лучшие модели без карточек: [(модель, номер размера, оценка)] по убыванию оценки"""
+    scores, columns = best_sizes({
+        'foot_length': user.get('foot_length'),
+        'foot_width': user.get('foot_width'),
+        'arch': user.get('arch'),
+        'foot_type': user.get('foot_type')
+    }, catalog_matrix(snapshot))
+    matches = [(shoe['model'], column, best_compatibility)
+               for shoe, best_compatibility, column in zip(snapshot.sneakers, scores.tolist(), columns.tolist())
+               if best_compatibility >= MIN_COMPATIBILITY]
+    matches.sort(key=lambda x: x[2], reverse=True)
+    return matches[:RECOMMENDATIONS_LIMIT]
+
+
+def _normalized(value):
+    """Мерка как её видит подбор: пустое — None, число — float"""
+    if not (value and str(value).strip()):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def measurements_key(user):
+    """Ключ кеша подбора: только поля, от которых зависит compute_matches"""
+    foot_type = user.get('foot_type')
+    return (
+        _normalized(user.get('foot_length')),
+        _normalized(user.get('foot_width')),
+        foot_type if foot_type and foot_type.strip() else None,
+    )
+
+
+def rank_matches(user, snapshot):
+    """compute_matches через LRU-кеш: у многих пользователей мерки совпадают"""
+    matches_cache.validate(snapshot.version)
+    # Версия и в ключе: поток со старым снимком не получит подбор по новому
+    key = (snapshot.version, *measurements_key(user))
+    matches = matches_cache.get(key)
+    if matches is None:
+        matches = tuple(compute_matches(user, snapshot))
+        matches_cache.put(key, matches)
+    return matches
+
+
+def recommendation_cards(matches, snapshot):
+    """Карточки для /get_recommendations; None, если модели уже нет в каталоге"""
+    recommendations = []
+    for model, column, compatibility in matches:
+        shoe = snapshot.get_shoe(model)
+        if shoe is None or column >= len(shoe['sizes']):
+            return None
+        recommendations.append({
+            'model': shoe['model'],
+            'brand': brand_of(shoe),
+            'sport': shoe.get('sport', 1),
+            'shoeType': shoe_type_of(shoe),
+            'image': model_image(shoe['model']),
+            'compatibility': compatibility,
+            'best_size': shoe['sizes'][column],
+            'all_sizes': shoe['sizes']
+        })
+    return recommendations
+
+
+def find_best_matches(user, snapshot=None):
+    """Лучшие модели для пользователя с лучшим размером каждой"""
+    if not user:
+        return []
+
+    snapshot = snapshot or get_catalog()
+    return recommendation_cards(rank_matches(user, snapshot), snapshot)
+
+
+# ------------------ Таблица recommendations ------------------
+
+def store_matches(conn, user_id, matches, catalog_sha256):
+    """Заменяет подборку пользователя; коммит — за вызывающим"""
+    conn.execute("DELETE FROM recommendations WHERE user_id = ?", (user_id,))
+    conn.executemany(
+        "INSERT INTO recommendations (user_id, rank, model, size_position, compatibility) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(user_id, rank, model, column, compatibility)
+         for rank, (model, column, compatibility) in enumerate(matches)]
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO recommendation_state (user_id, catalog_sha256, updated_at) VALUES (?, ?, ?)",
+        (user_id, catalog_sha256, time.time())
+    )
+
+
+def refresh_user(conn, user, snapshot=None):
+    """Пересчитывает подборку одного пользователя внутри текущей транзакции"""
+    snapshot = snapshot or get_catalog()
+    if snapshot.sha256 is None:
+        return None
+    matches = rank_matches(user, snapshot)
+    store_matches(conn, user['id'], matches, snapshot.sha256)
+    return matches
+
+
+def load_matches(conn, user_id, catalog_sha256):
+    """Сохранённая подборка или None, если её нет или она для другого каталога"""
+    rows = conn.execute(
+        "SELECT st.catalog_sha256, r.model, r.size_position, r.compatibility "
+        "FROM recommendation_state st "
+        "LEFT JOIN recommendations r ON r.user_id = st.user_id "
+        "WHERE st.user_id = ? ORDER BY r.rank",
+        (user_id,)
+    ).fetchall()
+    if not rows or rows[0]['catalog_sha256'] != catalog_sha256:
+        return None
+    return [(row['model'], row['size_position'], row['compatibility']) for row in rows if row['model'] is not None]
+
+
+def user_recommendations(user):
+    """Подборка из таблицы; устаревшая или отсутствующая пересчитывается и сохраняется"""
+    if not user:
+        return []
+    snapshot = get_catalog()
+    conn = get_connection()
+    try:
+        matches = load_matches(conn, user['id'], snapshot.sha256)
+        if matches is not None:
+            cards = recommendation_cards(matches, snapshot)
+            if cards is not None:
+                recommendation_reads.inc('table')
+                return cards
+        recommendation_reads.inc('computed')
+        matches = refresh_user(conn, user, snapshot)
+        conn.commit()
+        if matches is None:
+            return find_best_matches(user, snapshot)
+        return recommendation_cards(matches, snapshot)
+    except Exception:
+        logger.exception("Error reading stored recommendations", extra={'user_id': user.get('id')})
+        conn.rollback()
+        return find_best_matches(user, snapshot)
+
+
+def size_measurements_key(user):
+    """Мерки, от которых зависит size_compatibility: те же плюс косой обхват"""
+    return (*measurements_key(user), _normalized(user.get('oblique_circumference')))
+
+
+def size_compatibility(shoe, user):
+    """Совместимость каждого размера модели, от лучшего к худшему"""
+    sizes_compatibility = []
+    for size in shoe['sizes']:
+        compatibility = calculate_compatibility({
+            'foot_length': user.get('foot_length'),
+            'foot_width': user.get('foot_width'),
+            'oblique_circumference': user.get('oblique_circumference'),
+            'foot_type': user.get('foot_type')
+        }, size, is_sport=shoe.get('sport', 1))
+
+        sizes_compatibility.append({
+            'size_data': size,
+            'compatibility': compatibility
+        })
+
+    sizes_compatibility.sort(key=lambda x: x['compatibility'], reverse=True)
+    return sizes_compatibility
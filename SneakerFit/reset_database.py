@@ -1,5 +1,7 @@
+import logging
 import os
-import sqlite3
+
+from database import setup_db
 
 
 def reset_database():
@@ -7,35 +9,16 @@ def reset_database():
     if os.path.exists('users.db'):
         os.remove('users.db')
         print("Old database removed")
+    # Файлы журнала WAL от старой базы
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists('users.db' + suffix):
+            os.remove('users.db' + suffix)
 
-    # Создаем новую
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        CREATE TABLE users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            registration_date TEXT,
-            registration_type TEXT,
-            subscription INTEGER DEFAULT 0,
-            foot_length REAL,
-            foot_width REAL,
-            arch TEXT,
-            oblique_circumference REAL,
-            foot_type TEXT,
-            avatar TEXT,
-            about TEXT DEFAULT '',
-            email_verified BOOLEAN DEFAULT FALSE
-        )
-    """)
-
-    conn.commit()
-    conn.close()
+    # Создаем новую той же цепочкой миграций, что и приложение
+    setup_db()
     print("New database created successfully")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     reset_database()
\ No newline at end of file
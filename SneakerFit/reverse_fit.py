@@ -0,0 +1,200 @@
+"""Обратный подбор: сколько пользователей подходит к размеру модели.
+
+Таблица users читается только нужными столбцами, диапазонами id,
+параллельно в нескольких процессах. Каждый процесс открывает базу
+только на чтение и оценивает свой диапазон той же функцией
+calculate_compatibility, что и страница модели.
+
+Запуск: python reverse_fit.py "New Balance 530" 42 --threshold 70
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from catalog import get_catalog
+from database import DB_FILE
+from scoring import calculate_compatibility
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 70
+# Меньше этого числа пользователей считаем в текущем процессе
+PARALLEL_MIN_USERS = 20000
+CHUNKS_PER_WORKER = 4
+FETCH_SIZE = 5000
+CACHE_SIZE = 128
+# Кеш привязан к версии каталога; пользователи меняются чаще, поэтому ещё и TTL
+CACHE_TTL = 300
+UNKNOWN_FOOT_TYPE = 'Не указан'
+
+_executor = None
+_executor_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class ReverseFitError(ValueError):
+    pass
+
+
+def _scan_chunk(db_path, low, high, size, is_sport, threshold):
+    """Оценивает пользователей с id в [low, high); возвращает {тип стопы: [всего, подходит]}"""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        cursor = conn.execute(
+            "SELECT foot_length, foot_width, oblique_circumference, foot_type "
+            "FROM users WHERE id >= ? AND id < ?",
+            (low, high)
+        )
+        counts = {}
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for foot_length, foot_width, oblique, foot_type in rows:
+                try:
+                    score = calculate_compatibility({
+                        'foot_length': foot_length,
+                        'foot_width': foot_width,
+                        'oblique_circumference': oblique,
+                        'foot_type': foot_type
+                    }, size, is_sport=is_sport)
+                except ValueError:
+                    score = 0
+                key = foot_type if foot_type and foot_type.strip() else UNKNOWN_FOOT_TYPE
+                entry = counts.setdefault(key, [0, 0])
+                entry[0] += 1
+                if score >= threshold:
+                    entry[1] += 1
+        return counts
+    finally:
+        conn.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: веб-процесс многопоточный, fork в нём небезопасен
+            _executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 2,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _id_ranges(db_path, parts):
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        low, high, total = conn.execute("SELECT MIN(id), MAX(id), COUNT(*) FROM users").fetchone()
+    finally:
+        conn.close()
+    if not total:
+        return [], 0
+    step = max((high - low + 1) // parts + 1, 1)
+    return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)], total
+
+
+def count_fitting_users(model_name, eu, threshold=DEFAULT_THRESHOLD, db_file=DB_FILE, parallel=None):
+    """Сколько пользователей получают для размера оценку не ниже threshold, по типам стопы"""
+    snapshot = get_catalog()
+    shoe = snapshot.get_shoe(model_name)
+    if not shoe:
+        raise ReverseFitError(f"Модель не найдена: {model_name}")
+    size = next((s for s in shoe['sizes'] if float(s['eu']) == float(eu)), None)
+    if size is None:
+        raise ReverseFitError(f"У модели {model_name} нет размера EU {eu}")
+
+    key = (snapshot.version, model_name, float(eu), threshold, db_file)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and time.monotonic() - cached[0] < CACHE_TTL:
+            _cache.move_to_end(key)
+            return cached[1]
+
+    started = time.perf_counter()
+    db_path = os.path.abspath(db_file)
+    is_sport = shoe.get('sport', 1)
+    workers = os.cpu_count() or 2
+    ranges, total = _id_ranges(db_path, workers * CHUNKS_PER_WORKER)
+    if parallel is None:
+        parallel = total >= PARALLEL_MIN_USERS
+
+    parts = None
+    if parallel and ranges:
+        try:
+            executor = _get_executor()
+            futures = [executor.submit(_scan_chunk, db_path, low, high, dict(size), is_sport, threshold)
+                       for low, high in ranges]
+            parts = [future.result() for future in futures]
+        except BrokenProcessPool:
+            # Упавший пул пересоздаётся при следующем вызове, а этот считаем сами
+            logger.exception("Reverse fit worker pool broken")
+            _reset_executor()
+    if parts is None:
+        parts = [_scan_chunk(db_path, low, high, size, is_sport, threshold) for low, high in ranges]
+
+    by_foot_type = {}
+    for part in parts:
+        for foot_type, (users, fitting) in part.items():
+            entry = by_foot_type.setdefault(foot_type, {'users': 0, 'fitting': 0})
+            entry['users'] += users
+            entry['fitting'] += fitting
+
+    result = {
+        'model': model_name,
+        'eu': size['eu'],
+        'threshold': threshold,
+        'users': sum(entry['users'] for entry in by_foot_type.values()),
+        'fitting': sum(entry['fitting'] for entry in by_foot_type.values()),
+        'by_foot_type': by_foot_type,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    logger.info("Reverse fit computed", extra={'model': model_name, 'eu': size['eu'],
+                                               'users': result['users'], 'seconds': result['seconds']})
+
+    with _cache_lock:
+        _cache[key] = (time.monotonic(), result)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сколько пользователей подходит к размеру модели')
+    parser.add_argument('model')
+    parser.add_argument('eu', type=float)
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--serial', action='store_true', help='считать в одном процессе')
+    args = parser.parse_args()
+
+    try:
+        result = count_fitting_users(args.model, args.eu, args.threshold, args.db,
+                                     parallel=False if args.serial else None)
+    except ReverseFitError as e:
+        print(e)
+        return 1
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,421 @@
+import numpy as np
+
+# Ступенчатые таблицы оценки: (порог разницы в мм, баллы)
+LENGTH_STEPS = (3, 7, 12, 17, 22)
+LENGTH_SCORES = (45, 40, 35, 25, 15, 5)
+WIDTH_STEPS = (15, 25, 35, 45, 55)
+WIDTH_SCORES = (35, 30, 25, 18, 10, 5)
+OBLIQUE_STEPS = (10, 20, 30, 40)
+OBLIQUE_SCORES = (15, 12, 8, 5, 2)
+
+LENGTH_FACTOR = 46
+WIDTH_FACTOR = 29
+OBLIQUE_FACTOR = 17
+FOOT_TYPE_FACTOR = 8
+
+
+def calculate_compatibility(user_data, shoe_size, is_sport=1):
+    compatibility = 0
+    factors = 0
+
+    has_length = user_data.get('foot_length') and str(user_data['foot_length']).strip()
+    has_width = user_data.get('foot_width') and str(user_data['foot_width']).strip()
+    has_oblique = user_data.get('oblique_circumference') and str(user_data['oblique_circumference']).strip()
+    has_foot_type = user_data.get('foot_type') and user_data['foot_type'].strip()
+
+    if has_length:
+        try:
+            user_length = float(user_data['foot_length']) * 10
+            shoe_length = shoe_size['length']
+            user_length += 10 if is_sport == 1 else 15
+            length_diff = abs(user_length - shoe_length)
+            if length_diff <= 3:
+                length_score = 45
+            elif length_diff <= 7:
+                length_score = 40
+            elif length_diff <= 12:
+                length_score = 35
+            elif length_diff <= 17:
+                length_score = 25
+            elif length_diff <= 22:
+                length_score = 15
+            else:
+                length_score = 5
+            compatibility += length_score
+            factors += 46
+        except ValueError:
+            pass
+
+    if has_width:
+        try:
+            user_width = float(user_data['foot_width']) * 10
+            estimated_midfoot = 2 * (user_width + 50) * 0.9
+            user_width += 10 if is_sport == 1 else 15
+            shoe_midfoot = shoe_size['midfootCircumference']
+            width_diff = abs(estimated_midfoot - shoe_midfoot)
+            if width_diff <= 15:
+                width_score = 35
+            elif width_diff <= 25:
+                width_score = 30
+            elif width_diff <= 35:
+                width_score = 25
+            elif width_diff <= 45:
+                width_score = 18
+            elif width_diff <= 55:
+                width_score = 10
+            else:
+                width_score = 5
+            compatibility += width_score
+            factors += 29
+        except ValueError:
+            pass
+
+    if has_oblique:
+        try:
+            user_oblique = float(user_data['oblique_circumference']) * 10
+            shoe_oblique = shoe_size['obliqueCircumference']
+            user_oblique += 10 if is_sport == 1 else 15
+            oblique_diff = abs(user_oblique - shoe_oblique)
+            if oblique_diff <= 10:
+                oblique_score = 15
+            elif oblique_diff <= 20:
+                oblique_score = 12
+            elif oblique_diff <= 30:
+                oblique_score = 8
+            elif oblique_diff <= 40:
+                oblique_score = 5
+            else:
+                oblique_score = 2
+            compatibility += oblique_score
+            factors += 17
+        except ValueError:
+            pass
+
+    if has_foot_type:
+        foot_type = user_data['foot_type']
+        if foot_type == 'Плоскостопие':
+            ankle_circ = shoe_size['ankleCircumference']
+            midfoot_circ = shoe_size['midfootCircumference']
+            foot_type_score = 5 if ankle_circ > 240 and midfoot_circ > 220 else 3 if ankle_circ > 230 and midfoot_circ > 210 else 1
+        elif foot_type == 'Супинация':
+            toe_circ = shoe_size['toeCircumference']
+            foot_type_score = 5 if toe_circ > 240 else 3 if toe_circ > 220 else 1
+        else:
+            foot_type_score = 4
+        compatibility += foot_type_score
+        factors += 8
+
+    final_compatibility = min(98, int(compatibility * 100 / factors)) if factors > 0 else 0
+
+    if has_length:
+        user_length = float(user_data['foot_length']) * 10
+        shoe_length = shoe_size['length'] + (4 if is_sport == 1 else 6)
+        if abs(user_length - shoe_length) <= 2:
+            final_compatibility = min(100, final_compatibility + 5)
+
+    return final_compatibility
+
+
+# ------------------ Пакетная оценка всего каталога ------------------
+
+# Производные массивы матрицы, которые хранит скомпилированный каталог,
+# плюс length_scale — база и шаг ключей length_keys
+INDEX_ARRAYS = ('model_index', 'is_sport', 'gather', 'length_order', 'length_keys')
+
+
+class CatalogMatrix:
+    """Колоночное представление каталога для пакетной оценки.
+
+    Все размеры всех моделей лежат подряд в плоских массивах,
+    offsets[i]:offsets[i + 1] — размеры i-й модели. Матрица
+    модели × размеры собирается через gather (-1 — пустая ячейка).
+    """
+
+    def __init__(self, sneakers):
+        sizes = [size for shoe in sneakers for size in shoe['sizes']]
+        offsets = np.zeros(len(sneakers) + 1, dtype=np.int64)
+        np.cumsum([len(shoe['sizes']) for shoe in sneakers], out=offsets[1:])
+        self._set_columns(
+            offsets,
+            np.array([s['length'] for s in sizes], dtype=np.float64),
+            np.array([s['toeCircumference'] for s in sizes], dtype=np.float64),
+            np.array([s['midfootCircumference'] for s in sizes], dtype=np.float64),
+            np.array([s['ankleCircumference'] for s in sizes], dtype=np.float64),
+            np.array([s['obliqueCircumference'] for s in sizes], dtype=np.float64),
+            np.array([shoe.get('sport', 1) for shoe in sneakers]),
+        )
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Матрица поверх готовых столбцов скомпилированного каталога, без копирования.
+
+        Индексы, которые записал compile_catalog.py, тоже берутся из файла.
+        """
+        matrix = cls.__new__(cls)
+        if all(hasattr(columns, name) for name in INDEX_ARRAYS + ('length_scale',)):
+            matrix._set_base(columns.offsets, columns.length, columns.toe, columns.midfoot,
+                             columns.ankle, columns.oblique)
+            for name in INDEX_ARRAYS:
+                setattr(matrix, name, getattr(columns, name))
+            matrix._length_base, matrix._length_stride = columns.length_scale.tolist()
+        else:
+            matrix._set_columns(columns.offsets, columns.length, columns.toe, columns.midfoot,
+                                columns.ankle, columns.oblique, columns.sport)
+        return matrix
+
+    def _set_base(self, offsets, length, toe, midfoot, ankle, oblique):
+        self.offsets = offsets
+        self.length = length
+        self.toe = toe
+        self.midfoot = midfoot
+        self.ankle = ankle
+        self.oblique = oblique
+
+    def _set_columns(self, offsets, length, toe, midfoot, ankle, oblique, sport):
+        self._set_base(offsets, length, toe, midfoot, ankle, oblique)
+        counts = np.diff(offsets)
+        models = len(offsets) - 1
+        total = int(offsets[-1])
+
+        self.model_index = np.repeat(np.arange(models), counts)
+        self.is_sport = (np.asarray(sport) == 1)[self.model_index]
+
+        columns = np.arange(total) - self.offsets[self.model_index]
+        self.gather = np.full((models, int(counts.max()) if models else 0), -1, dtype=np.int64)
+        self.gather[self.model_index, columns] = np.arange(total)
+
+        # Индекс длин: размеры в порядке (модель, длина). Каждая модель
+        # занимает свою полосу ключей, так что один searchsorted ищет
+        # длину сразу во всех моделях.
+        self.length_order = np.lexsort((self.length, self.model_index))
+        self._length_base = self.length.min() - 1 if total else 0.0
+        self._length_stride = self.length.max() - self._length_base + 2 if total else 1.0
+        keys = self.model_index * self._length_stride + (self.length - self._length_base)
+        self.length_keys = keys[self.length_order]
+
+    def index_arrays(self):
+        """Производные индексы для записи в скомпилированный каталог"""
+        arrays = {name: getattr(self, name) for name in INDEX_ARRAYS}
+        arrays['length_scale'] = np.array([self._length_base, self._length_stride], dtype=np.float64)
+        return arrays
+
+    def __len__(self):
+        return len(self.length)
+
+    def length_bounds(self, low, high):
+        """Границы [lo, hi) в length_order для длин из [low, high] каждой модели"""
+        band = np.arange(len(self.offsets) - 1) * self._length_stride
+        top = self._length_stride - 1
+        low = np.clip(low - self._length_base, 0, top)
+        high = np.clip(high - self._length_base, 0, top)
+        lo = np.searchsorted(self.length_keys, band + low, side='left')
+        hi = np.searchsorted(self.length_keys, band + high, side='right')
+        return lo, hi
+
+
+def catalog_matrix(snapshot):
+    def build(s):
+        if s.columns is not None:
+            return CatalogMatrix.from_columns(s.columns)
+        return CatalogMatrix(s.sneakers)
+    return snapshot.derived('matrix', build)
+
+
+def _measurement(user_data, key):
+    """Значение измерения в см или None, как в calculate_compatibility"""
+    value = user_data.get(key)
+    if not (value and str(value).strip()):
+        return None
+    return float(value)
+
+
+def _step_scores(diff, steps, scores):
+    return np.asarray(scores, dtype=np.int64)[np.searchsorted(steps, diff, side='left')]
+
+
+def score_sizes(user_data, matrix, rows=None):
+    """Оценивает размеры каталога для одного пользователя.
+
+    Результат совпадает с calculate_compatibility для каждого размера.
+    rows — номера размеров в плоских массивах, по умолчанию все.
+    """
+    def column(values):
+        return values if rows is None else values[rows]
+
+    length = column(matrix.length)
+    midfoot = column(matrix.midfoot)
+    shift = np.where(column(matrix.is_sport), 10, 15)
+
+    compatibility = np.zeros(len(length), dtype=np.int64)
+    factors = 0
+
+    # Некорректная длина роняет calculate_compatibility, поэтому float() без try
+    user_length = _measurement(user_data, 'foot_length')
+    if user_length is not None:
+        diff = np.abs(user_length * 10 + shift - length)
+        compatibility += _step_scores(diff, LENGTH_STEPS, LENGTH_SCORES)
+        factors += LENGTH_FACTOR
+
+    try:
+        user_width = _measurement(user_data, 'foot_width')
+    except ValueError:
+        user_width = None
+    if user_width is not None:
+        estimated_midfoot = 2 * (user_width * 10 + 50) * 0.9
+        diff = np.abs(estimated_midfoot - midfoot)
+        compatibility += _step_scores(diff, WIDTH_STEPS, WIDTH_SCORES)
+        factors += WIDTH_FACTOR
+
+    try:
+        user_oblique = _measurement(user_data, 'oblique_circumference')
+    except ValueError:
+        user_oblique = None
+    if user_oblique is not None:
+        diff = np.abs(user_oblique * 10 + shift - column(matrix.oblique))
+        compatibility += _step_scores(diff, OBLIQUE_STEPS, OBLIQUE_SCORES)
+        factors += OBLIQUE_FACTOR
+
+    foot_type = user_data.get('foot_type')
+    if foot_type and foot_type.strip():
+        if foot_type == 'Плоскостопие':
+            ankle = column(matrix.ankle)
+            compatibility += np.where((ankle > 240) & (midfoot > 220), 5,
+                                      np.where((ankle > 230) & (midfoot > 210), 3, 1))
+        elif foot_type == 'Супинация':
+            toe = column(matrix.toe)
+            compatibility += np.where(toe > 240, 5, np.where(toe > 220, 3, 1))
+        else:
+            compatibility += 4
+        factors += FOOT_TYPE_FACTOR
+
+    if factors == 0:
+        return np.zeros(len(length), dtype=np.int64)
+    final = np.minimum(98, (compatibility * 100 / factors).astype(np.int64))
+
+    if user_length is not None:
+        bonus = np.abs(user_length * 10 - (length + np.where(shift == 10, 4, 6))) <= 2
+        final = np.where(bonus, np.minimum(100, final + 5), final)
+    return final
+
+
+def score_matrix(user_data, matrix):
+    """Матрица оценок модели × размеры, -1 в пустых ячейках"""
+    scores = score_sizes(user_data, matrix)
+    return np.where(matrix.gather >= 0, scores[matrix.gather], -1)
+
+
+def _best_sizes_full(user_data, matrix):
+    if matrix.gather.size == 0:
+        empty = np.zeros(len(matrix.gather), dtype=np.int64)
+        return empty, empty
+    scores = score_matrix(user_data, matrix)
+    columns = scores.argmax(axis=1)
+    return scores[np.arange(len(scores)), columns], columns
+
+
+def _ranges(lo, hi):
+    """Склеивает диапазоны [lo[i], hi[i]) в один массив индексов"""
+    counts = hi - lo
+    starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+    return starts + np.arange(counts.sum())
+
+
+def _pick_best(user_data, matrix, rows):
+    """Лучший из rows размер каждой модели; при равенстве — первый по порядку"""
+    scores = score_sizes(user_data, matrix, rows)
+    models = matrix.model_index[rows]
+    order = np.lexsort((rows, -scores, models))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = models[order][1:] != models[order][:-1]
+    order = order[first]
+
+    best = np.zeros(len(matrix.offsets) - 1, dtype=np.int64)
+    columns = np.zeros(len(best), dtype=np.int64)
+    best[models[order]] = scores[order]
+    columns[models[order]] = rows[order] - matrix.offsets[models[order]]
+    return best, columns
+
+
+def length_window_bounds(user_data, matrix):
+    """Окно размеров каждой модели, вне которого лучший размер быть не может.
+
+    Возвращает границы [lo, hi) в matrix.length_order или None, если
+    длина стопы не указана.
+
+    Почему окно точное. Всё, кроме длины, даёт размеру не больше
+    other = 35 (ширина) + 15 (косой обхват) + 5 (тип стопы) баллов
+    по заданным факторам, а надбавка за длину — не больше +5. Значит,
+    размер с баллом за длину score(d) оценивается не выше
+    ub(d) = min(100, min(98, int(100 * (score(d) + other) / factors)) + 5),
+    и ub(d) не растёт с ростом разницы длин d. Нижняя граница lb
+    лучшей оценки модели — точная оценка двух соседей целевой длины
+    (длина стопы + 10/15 мм), найденных бинарным поиском. Окно —
+    размеры с d не больше порога ступени, на которой ub ещё >= lb;
+    у всех размеров снаружи ub < lb, поэтому они не могут ни
+    превзойти лучший размер, ни сравняться с ним.
+    """
+    user_length = _measurement(user_data, 'foot_length')
+    if user_length is None or len(matrix) == 0:
+        return None
+
+    starts, ends = matrix.offsets[:-1], matrix.offsets[1:]
+    filled = ends > starts
+    target = user_length * 10 + np.where(matrix.is_sport[np.minimum(starts, len(matrix) - 1)], 10, 15)
+
+    # Соседи целевой длины: последний размер короче цели и первый не короче
+    point, _ = matrix.length_bounds(target, target)
+    below = np.clip(point - 1, starts, np.maximum(ends - 1, starts))
+    above = np.clip(point, starts, np.maximum(ends - 1, starts))
+    neighbours = matrix.length_order[np.concatenate([below[filled], above[filled]])]
+    lower_bound, _ = _pick_best(user_data, matrix, neighbours)
+
+    reach = length_reach(user_data, lower_bound)
+    # Небольшой запас против округления ключей: лишний размер лишь будет оценён
+    lo, hi = matrix.length_bounds(target - reach - 1e-3, target + reach + 1e-3)
+    return np.where(filled, lo, starts), np.where(filled, hi, starts)
+
+
+def length_reach(user_data, lower_bound):
+    """Наибольшая разница длин, при которой размер ещё может набрать lower_bound.
+
+    lower_bound — число или массив; ответ той же формы. Длина стопы
+    должна быть известна. Обоснование — в length_window_bounds.
+    """
+    factors = LENGTH_FACTOR
+    other = 0
+    try:
+        if _measurement(user_data, 'foot_width') is not None:
+            factors += WIDTH_FACTOR
+            other += WIDTH_SCORES[0]
+    except ValueError:
+        pass
+    try:
+        if _measurement(user_data, 'oblique_circumference') is not None:
+            factors += OBLIQUE_FACTOR
+            other += OBLIQUE_SCORES[0]
+    except ValueError:
+        pass
+    foot_type = user_data.get('foot_type')
+    if foot_type and foot_type.strip():
+        factors += FOOT_TYPE_FACTOR
+        other += 5
+
+    upper = np.array([min(100, min(98, int((score + other) * 100 / factors)) + 5)
+                      for score in LENGTH_SCORES])
+    lower_bound = np.asarray(lower_bound)
+    level = (upper >= lower_bound[..., None]).sum(axis=-1) - 1
+    return np.array(LENGTH_STEPS + (np.inf,))[np.maximum(level, 0)]
+
+
+def best_sizes(user_data, matrix):
+    """Лучший размер каждой модели: (оценки, номера размеров внутри модели).
+
+    При равных оценках выбирается первый размер, как в исходном цикле.
+    Если длина стопы известна, оцениваются только размеры из окна
+    length_window_bounds, иначе — все размеры.
+    """
+    bounds = length_window_bounds(user_data, matrix)
+    if bounds is None:
+        return _best_sizes_full(user_data, matrix)
+    rows = matrix.length_order[_ranges(*bounds)]
+    return _pick_best(user_data, matrix, rows)
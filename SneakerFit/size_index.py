@@ -0,0 +1,92 @@
+import numpy as np
+
+from scoring import LENGTH_STEPS, _measurement, catalog_matrix, length_reach, score_sizes
+
+
+def _top(rows, scores, limit):
+    """limit строк с наибольшей оценкой; при равенстве — в порядке каталога"""
+    if len(scores) > limit:
+        kth = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        keep = scores >= kth
+        rows, scores = rows[keep], scores[keep]
+    order = np.lexsort((rows, -scores))[:limit]
+    return rows[order], scores[order]
+
+
+class LengthOrder:
+    """Размеры спортивных и повседневных моделей, отсортированные по длине.
+
+    У них разный запас длины, поэтому и целевая длина своя; размеры
+    с длиной target ± reach занимают в каждом порядке один отрезок.
+    """
+
+    def __init__(self, matrix):
+        self.groups = []
+        for is_sport, shift in ((True, 10), (False, 15)):
+            rows = np.flatnonzero(matrix.is_sport == is_sport)
+            rows = rows[np.argsort(matrix.length[rows], kind='stable')]
+            self.groups.append((shift, rows, matrix.length[rows]))
+
+    def rows(self, user_length, reach):
+        """Номера размеров, у которых разница с целевой длиной не больше reach"""
+        found = []
+        for shift, rows, lengths in self.groups:
+            target = user_length * 10 + shift
+            # Небольшой запас против округления: лишний размер лишь будет оценён
+            lo = np.searchsorted(lengths, target - reach - 1e-3, side='left')
+            hi = np.searchsorted(lengths, target + reach + 1e-3, side='right')
+            found.append(rows[lo:hi])
+        return np.concatenate(found)
+
+
+def length_order(snapshot):
+    return snapshot.derived('length_order', lambda s: LengthOrder(catalog_matrix(s)))
+
+
+def candidate_rows(user_data, snapshot, limit):
+    """Размеры, среди которых точно есть limit лучших.
+
+    Размеры оцениваются от ближайших по длине: как только их набралось
+    limit, limit-я оценка среди них — нижняя граница ответа. Размеры,
+    чья разница длин не позволяет дотянуть до этой границы (length_reach),
+    отбрасываются. Без длины стопы отбрасывать нечего — оцениваются все.
+    """
+    matrix = catalog_matrix(snapshot)
+    user_length = _measurement(user_data, 'foot_length')
+    if user_length is None:
+        return np.arange(len(matrix))
+    order = length_order(snapshot)
+    for reach in LENGTH_STEPS:
+        rows = order.rows(user_length, reach)
+        if len(rows) >= limit:
+            break
+    else:
+        return np.arange(len(matrix))
+    scores = score_sizes(user_data, matrix, rows)
+    floor = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+    return order.rows(user_length, float(length_reach(user_data, floor)))
+
+
+def nearest_sizes(user_data, snapshot, limit=10):
+    """limit лучших размеров из всего каталога.
+
+    Точный перебор: кандидаты отбираются по длине без потери лучших
+    (candidate_rows) и оцениваются той же score_sizes. При равных
+    оценках размеры идут в порядке каталога.
+    """
+    matrix = catalog_matrix(snapshot)
+    if len(matrix) == 0 or limit <= 0:
+        return []
+    rows = candidate_rows(user_data, snapshot, limit)
+    rows, scores = _top(rows, score_sizes(user_data, matrix, rows), limit)
+
+    result = []
+    for row, score in zip(rows.tolist(), scores.tolist()):
+        model = int(matrix.model_index[row])
+        shoe = snapshot.sneakers[model]
+        result.append({
+            'model': shoe['model'],
+            'compatibility': int(score),
+            'size': shoe['sizes'][row - int(matrix.offsets[model])]
+        })
+    return result
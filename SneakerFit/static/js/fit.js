@@ -52,18 +52,11 @@ async function loadRecommendations() {
         // Показываем секцию фильтров только если есть рекомендации
         if (filterSection) filterSection.style.display = 'block';
 
-        // Добавляем тип обуви к каждой рекомендации
-        const recommendationsWithType = await Promise.all(
-            recommendations.map(async rec => {
-                const shoeType = await getShoeType(rec.model);
-                return {
-                    ...rec,
-                    shoeType: shoeType
-                };
-            })
-        );
-
-        allRecommendations = recommendationsWithType;
+        // Тип обуви уже приходит в рекомендациях с сервера
+        allRecommendations = recommendations.map(rec => ({
+            ...rec,
+            shoeType: rec.shoeType || 'sport'
+        }));
         initializeFilters();
         applyFiltersAndDisplay();
 
@@ -84,26 +77,6 @@ async function loadRecommendations() {
     }
 }
 
-// Функция для определения типа обуви по модели
-async function getShoeType(modelName) {
-    try {
-        const response = await fetch('/get_shoe_type?model=' + encodeURIComponent(modelName));
-        if (!response.ok) return 'sport';
-        const data = await response.json();
-        return data.shoeType || 'sport';
-    } catch (error) {
-        console.error('Error getting shoe type:', error);
-        // Определяем тип по названию модели (эвристика)
-        const modelLower = modelName.toLowerCase();
-        if (modelLower.includes('runner') || modelLower.includes('st') || modelLower.includes('sport')) {
-            return 'sport';
-        } else if (modelLower.includes('club') || modelLower.includes('court') || modelLower.includes('lifestyle')) {
-            return 'casual';
-        }
-        return 'sport';
-    }
-}
-
 function initializeFilters() {
     const compatibilityFilter = document.getElementById('compatibilityFilter');
     const sortFilter = document.getElementById('sortFilter');
@@ -191,7 +164,7 @@ function displayRecommendations(recommendations, count) {
     let html = '<div class="recommendations-grid">';
 
     for (const rec of recommendationsToShow) {
-        const imageUrl = getShoeImageUrl(rec.model);
+        const image = rec.image || { src: getShoeImageUrl(rec.model) };
         const compatibilityColor = getCompatibilityColor(rec.compatibility);
         const typeText = rec.shoeType === 'sport' ? 'Спортивная' : 'Повседневная';
         const typeClass = rec.shoeType === 'sport' ? 'sport-badge' : 'casual-badge';
@@ -200,8 +173,11 @@ function displayRecommendations(recommendations, count) {
             <div class="shoe-card">
                 <div>
                     <div class="shoe-image">
-                        <img src="${imageUrl}" alt="${rec.model}"
-                             onerror="this.src='https://via.placeholder.com/250x200/4285f4/ffffff?text='+encodeURIComponent('${rec.model.split(' ')[0]}')">
+                        <picture>
+                            ${image.webpSrcset ? `<source type="image/webp" srcset="${image.webpSrcset}" sizes="250px">` : ''}
+                            <img src="${image.src}" ${image.srcset ? `srcset="${image.srcset}" sizes="250px"` : ''} alt="${rec.model}" loading="lazy"
+                                 onerror="this.src='https://via.placeholder.com/250x200/4285f4/ffffff?text='+encodeURIComponent('${rec.model.split(' ')[0]}')">
+                        </picture>
                     </div>
                     <div class="shoe-model">${rec.model}</div>
                     <div class="compatibility-badge" style="background: ${compatibilityColor}">
@@ -2,101 +2,59 @@ let currentImages = [];
 let currentImageIndex = 0;
 
 document.addEventListener('DOMContentLoaded', function() {
-    const modelName = document.querySelector('.info-section h1')?.textContent || "{{ shoe.model }}";
-    const images = loadModelImages(modelName);
-    renderGallery(images);
+    loadModelImages().then(renderGallery);
     initializeModal();
 });
 
-function loadModelImages(modelName) {
-    const images = [];
-    let imageIndex = 1;
-
-    while (imageIndex <= 10) {
-        const imageUrl = `/static/models%20photo/${encodeURIComponent(modelName)}/${imageIndex}.jpg`;
-
-        images.push({
-            url: imageUrl,
-            index: imageIndex
-        });
-
-        imageIndex++;
-
-        if (imageIndex > 10) break;
+// Список фотографий приходит вместе со страницей; запрос к серверу — запасной путь
+function loadModelImages() {
+    const embedded = document.getElementById('shoePhotos');
+    if (embedded) {
+        return Promise.resolve(JSON.parse(embedded.textContent));
     }
 
-    return images;
-}
-
-function checkImageExists(url, callback) {
-    const img = new Image();
-    img.onload = function() {
-        callback(true);
-    };
-    img.onerror = function() {
-        callback(false);
-    };
-    img.src = url;
+    const modelName = document.querySelector('.info-section h1')?.textContent || '';
+    return fetch(`/get_shoe_photos?model=${encodeURIComponent(modelName)}`)
+        .then(response => response.json())
+        .then(data => data.success ? data.photos : [])
+        .catch(() => []);
 }
 
 function renderGallery(images) {
     const mainImage = document.getElementById('mainImage');
     const thumbnailGallery = document.getElementById('thumbnailGallery');
 
-    const existingImages = [];
-    let checkedCount = 0;
-
     if (images.length === 0) {
-        showPlaceholder();
-        return;
-    }
-
-    images.forEach((image, index) => {
-        checkImageExists(image.url, function(exists) {
-            checkedCount++;
-            if (exists) {
-                existingImages.push(image);
-            }
-
-            if (checkedCount === images.length) {
-                if (existingImages.length === 0) {
-                    showPlaceholder();
-                } else {
-                    displayImages(existingImages);
-                }
-            }
-        });
-    });
-
-    function showPlaceholder() {
         mainImage.innerHTML = '<div style="color: #666; text-align: center; padding: 50px; font-size: 18px;">Изображение отсутствует</div>';
         thumbnailGallery.innerHTML = '';
+        return;
     }
 
-    function displayImages(validImages) {
-        currentImages = validImages;
-        currentImageIndex = 0;
-        updateMainImage();
+    currentImages = images;
+    currentImageIndex = 0;
+    updateMainImage();
 
-        thumbnailGallery.innerHTML = '';
-        validImages.forEach((image, index) => {
-            const thumbnail = document.createElement('div');
-            thumbnail.className = `thumbnail ${index === 0 ? 'active' : ''}`;
-            thumbnail.innerHTML = `<img src="${image.url}" alt="${image.index}">`;
-            thumbnail.addEventListener('click', () => {
-                currentImageIndex = index;
-                updateMainImage();
-                updateThumbnails();
-            });
-            thumbnailGallery.appendChild(thumbnail);
+    thumbnailGallery.innerHTML = '';
+    images.forEach((image, index) => {
+        const thumbnail = document.createElement('div');
+        thumbnail.className = `thumbnail ${index === 0 ? 'active' : ''}`;
+        thumbnail.innerHTML = `<img src="${image.thumb}" alt="${image.index}" loading="lazy">`;
+        thumbnail.addEventListener('click', () => {
+            currentImageIndex = index;
+            updateMainImage();
+            updateThumbnails();
         });
-    }
+        thumbnailGallery.appendChild(thumbnail);
+    });
 }
 
 function updateMainImage() {
     const mainImage = document.getElementById('mainImage');
     if (currentImages.length > 0) {
-        mainImage.innerHTML = `<img src="${currentImages[currentImageIndex].url}" alt="Image ${currentImages[currentImageIndex].index}">`;
+        const image = currentImages[currentImageIndex];
+        mainImage.innerHTML = image.webpSrcset
+            ? `<picture><source type="image/webp" srcset="${image.webpSrcset}" sizes="(max-width: 768px) 100vw, 50vw"><img src="${image.src}" srcset="${image.srcset}" sizes="(max-width: 768px) 100vw, 50vw" alt="Image ${image.index}"></picture>`
+            : `<img src="${image.src}" alt="Image ${image.index}">`;
     }
 }
 
@@ -151,7 +109,7 @@ function openModal() {
     const modalImage = document.getElementById('modalImage');
     const imageCounter = document.getElementById('imageCounter');
 
-    modalImage.src = currentImages[currentImageIndex].url;
+    modalImage.src = currentImages[currentImageIndex].full;
     imageCounter.textContent = `${currentImageIndex + 1} / ${currentImages.length}`;
     modal.style.display = 'flex';
     document.body.style.overflow = 'hidden';
@@ -173,7 +131,7 @@ function navigateModal(direction) {
     const modalImage = document.getElementById('modalImage');
     const imageCounter = document.getElementById('imageCounter');
 
-    modalImage.src = currentImages[currentImageIndex].url;
+    modalImage.src = currentImages[currentImageIndex].full;
     imageCounter.textContent = `${currentImageIndex + 1} / ${currentImages.length}`;
     updateMainImage();
     updateThumbnails();
@@ -21,6 +21,27 @@ document.addEventListener('DOMContentLoaded', function() {
     initCodeInputs();
     startTimer();
     setupEventListeners();
+    watchMailStatus();
+
+    // Письмо отправляется в фоне: опрашиваем сервер, пока оно не уйдет
+    function watchMailStatus() {
+        let polls = 0;
+        const poll = setInterval(async () => {
+            polls++;
+            try {
+                const response = await fetch('/mail_status');
+                const status = await response.json();
+                if (status.state === 'failed') {
+                    clearInterval(poll);
+                    showMessage('Не удалось отправить письмо. Запросите код повторно.', 'error');
+                } else if (status.state === 'sent' || status.state === 'unknown' || polls >= 30) {
+                    clearInterval(poll);
+                }
+            } catch (error) {
+                clearInterval(poll);
+            }
+        }, 2000);
+    }
 
     function initCodeInputs() {
         codeInputs.forEach((input, index) => {
@@ -207,6 +228,7 @@ document.addEventListener('DOMContentLoaded', function() {
                         resetCodeInputs();
 
                         startResendTimer();
+                        watchMailStatus();
                     } else {
                         showMessage(result.message, 'error');
                     }
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# Модули приложения лежат плоско в SneakerFit/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Пустая база со всеми миграциями вместо users.db"""
+    pool = database.ConnectionPool(str(tmp_path / 'users.db'))
+    monkeypatch.setattr(database, 'pool', pool)
+    conn = database.get_connection()
+    database.migrate(conn)
+    conn.close()
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture
+def client(db):
+    """Тестовый клиент приложения поверх временной базы"""
+    # Первый импорт app.py выполняет create_app() — уже на временной базе
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
@@ -0,0 +1,72 @@
+import sys
+
+import metrics
+from database import get_connection
+
+
+def _login(client, email):
+    with client.session_transaction() as session:
+        session['user_logged_in'] = True
+        session['user_email'] = email
+
+
+def test_users_list_requires_admin(client, monkeypatch):
+    conn = get_connection()
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bob', 'bob@x.ru', 'x')")
+    conn.commit()
+    conn.close()
+    # app импортирует фикстура client — уже поверх временной базы
+    monkeypatch.setattr(sys.modules['app'], 'ADMIN_EMAILS', {'admin@x.ru'})
+
+    response = client.get('/users?q=bob')
+    assert response.status_code == 302
+    assert b'bob@x.ru' not in response.data
+
+    _login(client, 'bob@x.ru')
+    response = client.get('/users?q=bob')
+    assert response.status_code == 403
+    assert b'bob@x.ru' not in response.data
+
+    _login(client, 'admin@x.ru')
+    response = client.get('/users?q=bob')
+    assert response.status_code == 200
+    assert b'bob@x.ru' in response.data
+
+
+def test_user_is_loaded_once_per_request(client, monkeypatch):
+    app_module = sys.modules['app']
+    conn = get_connection()
+    conn.execute("INSERT INTO users (username, email, password, email_verified, foot_length, foot_width) "
+                 "VALUES ('ann', 'ann@x.ru', 'x', 1, '26.5', '10')")
+    conn.commit()
+    conn.close()
+    reads = []
+    real_get_user = app_module.get_user_by_email
+    monkeypatch.setattr(app_module, 'get_user_by_email', lambda email: reads.append(email) or real_get_user(email))
+    _login(client, 'ann@x.ru')
+    model = app_module.get_catalog().sneakers[0]['model']
+
+    # email_verified_required и сам shoe_detail оба вызывают load_current_user()
+    with client:
+        response = client.get(f'/shoe/{model}')
+        assert response.status_code == 200
+        assert app_module.g.user_loads == 1
+    assert reads == ['ann@x.ru']
+
+
+def test_users_list_queries_are_counted(client, monkeypatch):
+    conn = get_connection()
+    conn.executemany("INSERT INTO users (username, email, password) VALUES (?, ?, 'x')",
+                     [(f'user{i}', f'user{i}@x.ru') for i in range(3)])
+    conn.commit()
+    monkeypatch.setattr(sys.modules['app'], 'ADMIN_EMAILS', {'user0@x.ru'})
+    _login(client, 'user0@x.ru')
+    executed, observed = [], []
+    monkeypatch.setattr(metrics.sql_queries, 'inc', lambda *labels, **kw: executed.append(1))
+    monkeypatch.setattr(metrics.request_sql_queries, 'observe',
+                        lambda value, endpoint: observed.append((endpoint, value)))
+
+    response = client.get('/users')
+    assert b'user2@x.ru' in response.data
+    # Все запросы, включая чтение страницы, попали в метрики запроса /users
+    assert observed == [('view_users', len(executed))]
@@ -0,0 +1,33 @@
+import os
+import runpy
+
+import pytest
+
+import code_store
+import database
+import log_config
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    called = []
+    monkeypatch.setattr(database, 'setup_db', lambda: called.append('setup_db'))
+    monkeypatch.setattr(log_config, 'setup_logging', lambda: called.append('setup_logging'))
+    monkeypatch.setattr(code_store, 'start_sweeper', lambda stores: called.append('start_sweeper'))
+    return called
+
+
+def test_spawn_child_import_has_no_side_effects(calls):
+    # Так app.py импортируют процессы spawn пула reverse_fit
+    namespace = runpy.run_path(APP_PATH, run_name='__mp_main__')
+    assert calls == []
+    assert namespace['count_fitting_users']
+
+
+def test_regular_import_initializes_once(calls):
+    namespace = runpy.run_path(APP_PATH, run_name='sneakerfit_app')
+    assert calls == ['setup_logging', 'setup_db', 'start_sweeper']
+    namespace['create_app']()
+    assert calls == ['setup_logging', 'setup_db', 'start_sweeper']
@@ -0,0 +1,85 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+import avatars
+from database import get_connection
+from user_service import collect_unused_avatar
+
+
+def _jpeg(size=(800, 600)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def test_main_thumbnail_exists_when_store_returns(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, 'AVATARS_DIR', str(tmp_path))
+    path = avatars.store_avatar(_jpeg())
+    assert os.path.exists(path)
+    assert path.endswith(f'_{avatars.AVATAR_SIZES[0]}.{avatars.AVATAR_EXT}')
+    # Крупный размер дорисовывается в фоне — ждём его, пока AVATARS_DIR подменён
+    large = path.replace(f'_{avatars.AVATAR_SIZES[0]}.', f'_{avatars.AVATAR_SIZES[-1]}.')
+    deadline = time.monotonic() + 10
+    while not os.path.exists(large) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert os.path.exists(large)
+
+
+def test_not_an_image():
+    with pytest.raises(avatars.AvatarError):
+        avatars.store_avatar(b'not an image')
+
+
+def test_avatar_in_use_is_not_collected(db):
+    conn = get_connection()
+    conn.execute("INSERT INTO users (username, email, password, avatar) VALUES ('a', 'a@x.ru', 'x', 'static/avatars/a.webp')")
+    conn.commit()
+    conn.close()
+    removed = []
+    assert not collect_unused_avatar('static/avatars/a.webp', removed.append)
+    assert collect_unused_avatar('static/avatars/b.webp', removed.append)
+    assert removed == ['static/avatars/b.webp']
+
+
+def _png(size):
+    buffer = io.BytesIO()
+    Image.new('1', size).save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+# pytest сбрасывает фильтры предупреждений — возвращаем тот, что ставит avatars.py
+@pytest.mark.filterwarnings('error::PIL.Image.DecompressionBombWarning')
+def test_decompression_bomb_is_refused_before_decoding(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, 'AVATARS_DIR', str(tmp_path))
+    # Несколько килобайт PNG на 100 мегапикселей
+    data = _png((10000, 10000))
+    assert len(data) < avatars.MAX_AVATAR_BYTES
+    with pytest.raises(avatars.AvatarError, match='слишком большое'):
+        avatars.store_avatar(data)
+    with pytest.raises(avatars.AvatarError):
+        avatars.ensure_avatar(data)
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.filterwarnings('error::PIL.Image.DecompressionBombWarning')
+def test_upload_of_huge_image_returns_400(client, monkeypatch, tmp_path):
+    avatars_dir = tmp_path / 'avatars'
+    avatars_dir.mkdir()
+    monkeypatch.setattr(avatars, 'AVATARS_DIR', str(avatars_dir))
+    conn = get_connection()
+    conn.execute("INSERT INTO users (username, email, password, email_verified) VALUES ('a', 'a@x.ru', 'x', 1)")
+    conn.commit()
+    conn.close()
+    with client.session_transaction() as session:
+        session['user_logged_in'] = True
+        session['user_email'] = 'a@x.ru'
+    for size in ((6000, 6000), (10000, 10000)):
+        upload = (io.BytesIO(_png(size)), 'a.png')
+        response = client.post('/profile_update', data={'about': '', 'avatar': upload},
+                               content_type='multipart/form-data')
+        assert response.status_code == 400
+    assert os.listdir(avatars_dir) == []
@@ -0,0 +1,88 @@
+import json
+import sqlite3
+
+import pytest
+
+import catalog_db
+from catalog import CatalogError, CatalogSnapshot, CatalogStore
+from database import get_connection
+
+
+def _shoe(model, sport=1):
+    return {'model': model, 'sport': sport, 'sizes': [{
+        'eu': 42, 'length': 270, 'toeCircumference': 230, 'midfootCircumference': 240,
+        'ankleCircumference': 250, 'obliqueCircumference': 330,
+    }]}
+
+
+@pytest.fixture
+def snapshot(db, monkeypatch):
+    """Каталог из двух моделей; таблицы models и sizes ещё пусты"""
+    current = CatalogSnapshot({'sneakers': [_shoe('Nike Pegasus'), _shoe('Vans Old Skool', 0)]},
+                              version='v1', sha256='a' * 64)
+    monkeypatch.setattr(catalog_db, 'get_catalog', lambda: current)
+    monkeypatch.setattr(catalog_db, '_synced_version', None)
+    monkeypatch.setattr(catalog_db, '_failed_sync', None)
+    return current
+
+
+def test_get_shoe_after_sync(snapshot):
+    shoe = catalog_db.get_shoe('Vans Old Skool')
+    assert shoe['sport'] == 0
+    assert shoe['sizes'][0]['length'] == 270
+    assert catalog_db.get_shoe('Missing') is None
+
+
+def test_database_errors_propagate(snapshot, monkeypatch):
+    catalog_db.sync_catalog()
+
+    def broken():
+        raise sqlite3.OperationalError('disk I/O error')
+    monkeypatch.setattr(catalog_db, 'get_connection', broken)
+    with pytest.raises(sqlite3.OperationalError):
+        catalog_db.get_shoe('Nike Pegasus')
+    with pytest.raises(sqlite3.OperationalError):
+        catalog_db.get_shoe_sports(['Nike Pegasus'])
+    with pytest.raises(sqlite3.OperationalError):
+        catalog_db.find_sizes(eu=42)
+
+
+def test_failed_sync_backs_off(snapshot, monkeypatch):
+    attempts = []
+    real_import = catalog_db.import_catalog
+
+    def failing_import(conn, sneakers, sha256=None):
+        attempts.append(sha256)
+        raise sqlite3.IntegrityError('UNIQUE constraint failed: models.name')
+    monkeypatch.setattr(catalog_db, 'import_catalog', failing_import)
+
+    for _ in range(5):
+        assert catalog_db.get_shoe('Nike Pegasus') is None
+    assert len(attempts) == 1
+
+    # Срок вышел — следующий запрос пробует снова
+    monkeypatch.setattr(catalog_db, 'import_catalog', real_import)
+    monkeypatch.setattr(catalog_db, '_failed_sync', ('v1', 0))
+    assert catalog_db.get_shoe('Nike Pegasus')['model'] == 'Nike Pegasus'
+    assert catalog_db._failed_sync is None
+
+
+def test_json_with_duplicate_models_is_rejected(tmp_path):
+    path = tmp_path / 'base_of_shoes.json'
+    path.write_text(json.dumps({'sneakers': [_shoe('Nike Pegasus'), _shoe('Nike Pegasus')]}))
+    store = CatalogStore(str(path), str(tmp_path / 'missing.bin'))
+    with pytest.raises(CatalogError, match='дважды'):
+        store._load_json(store._file_stamp())
+    # Битый файл не публикуется: остаётся прежний (пустой) снимок
+    assert len(store.snapshot()) == 0
+
+
+def test_mirror_version_follows_tables(snapshot):
+    assert catalog_db.mirror_version() == 'a' * 64
+    # Другой воркер перезаполнил таблицы; снимок этого процесса не менялся
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    catalog_db.import_catalog(conn, [_shoe('Nike Pegasus', 0)], 'b' * 64)
+    conn.commit()
+    assert catalog_db.mirror_version() == 'b' * 64
+    assert catalog_db.get_shoe('Nike Pegasus')['sport'] == 0
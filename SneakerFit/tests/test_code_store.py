@@ -0,0 +1,63 @@
+import datetime
+import threading
+
+import pytest
+
+from code_store import create_store
+
+
+def _code(**extra):
+    return {'code': '12345', 'timestamp': datetime.datetime.now(), 'attempts': 0, 'used': False, **extra}
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, db):
+    return create_store('password_reset', request.param)
+
+
+def test_attempts_stop_at_limit(store):
+    store.put('a@x.ru', _code())
+    assert [store.register_attempt('a@x.ru', 3) for _ in range(5)] == [1, 2, 3, None, None]
+    assert store.get('a@x.ru')['attempts'] == 3
+
+
+def test_concurrent_attempts_do_not_exceed_limit(store):
+    store.put('a@x.ru', _code())
+    granted = []
+
+    def guess():
+        for _ in range(10):
+            granted.append(store.register_attempt('a@x.ru', 4))
+        from database import release_connection
+        release_connection()
+
+    threads = [threading.Thread(target=guess) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(n for n in granted if n is not None) == [1, 2, 3, 4]
+
+
+def test_code_is_confirmed_and_taken_once(store):
+    store.put('a@x.ru', _code())
+    assert not store.take_used('a@x.ru')
+    assert store.mark_used('a@x.ru')
+    assert not store.mark_used('a@x.ru')
+    assert store.take_used('a@x.ru')
+    assert not store.take_used('a@x.ru')
+    assert store.get('a@x.ru') is None
+
+
+def test_update_keeps_counters(store):
+    store.put('a@x.ru', _code())
+    store.register_attempt('a@x.ru', 4)
+    store.update('a@x.ru', last_resend=datetime.datetime(2026, 1, 1), attempts=0)
+    data = store.get('a@x.ru')
+    assert data['attempts'] == 1
+    assert data['last_resend'] == datetime.datetime(2026, 1, 1)
+
+
+def test_missing_code(store):
+    assert store.register_attempt('nobody@x.ru', 3) is None
+    assert not store.mark_used('nobody@x.ru')
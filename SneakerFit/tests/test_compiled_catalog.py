@@ -0,0 +1,47 @@
+import random
+
+import numpy as np
+
+from catalog import CatalogSnapshot, CompiledCatalog
+from compile_catalog import compile_catalog
+from scoring import INDEX_ARRAYS, CatalogMatrix, catalog_matrix
+from size_index import nearest_sizes
+from test_scoring import _catalog, _user
+
+
+def _compiled(tmp_path, sneakers):
+    path = tmp_path / 'base_of_shoes.bin'
+    path.write_bytes(compile_catalog({'sneakers': sneakers}))
+    compiled = CompiledCatalog(str(path))
+    return CatalogSnapshot({'sneakers': compiled.shoes()}, version='bin', columns=compiled)
+
+
+def test_derived_arrays_are_mapped_from_file(tmp_path):
+    sneakers = _catalog(random.Random(5), models=40)
+    snapshot = _compiled(tmp_path, sneakers)
+    matrix = catalog_matrix(snapshot)
+    built = CatalogMatrix(sneakers)
+    for name in INDEX_ARRAYS:
+        mapped = getattr(matrix, name)
+        # Массив — вид на mmap, а не копия
+        assert not mapped.flags.owndata
+        assert np.array_equal(mapped, getattr(built, name)), name
+    assert matrix.length_bounds(250, 260)[0].tolist() == built.length_bounds(250, 260)[0].tolist()
+
+
+def test_nearest_sizes_match_json(tmp_path):
+    rng = random.Random(6)
+    sneakers = _catalog(rng, models=40)
+    compiled = _compiled(tmp_path, sneakers)
+    source = CatalogSnapshot({'sneakers': sneakers}, version='json')
+    for _ in range(30):
+        user = _user(rng)
+        user['foot_length'] = round(rng.uniform(22.0, 30.0), 1)
+        assert nearest_sizes(user, compiled) == nearest_sizes(user, source)
+
+
+def test_compiled_sizes_are_built_once(tmp_path):
+    sneakers = _catalog(random.Random(7), models=3)
+    shoe = _compiled(tmp_path, sneakers).sneakers[1]
+    assert shoe['sizes'] is shoe['sizes']
+    assert shoe['sizes'] == sneakers[1]['sizes']
@@ -0,0 +1,42 @@
+import database
+import user_service
+
+
+def _insert_user(conn, email):
+    conn.execute("INSERT INTO users (username, email, password) VALUES (?, ?, 'x')", (email, email))
+
+
+def _emails(conn):
+    return [row['email'] for row in conn.execute("SELECT email FROM users ORDER BY id")]
+
+
+def test_close_keeps_callers_transaction(db):
+    conn = database.get_connection()
+    _insert_user(conn, 'a@x.ru')
+    # Вложенная функция берёт то же соединение потока и закрывает его
+    inner = database.get_connection()
+    assert inner is conn
+    inner.close()
+    assert conn.in_transaction
+    conn.commit()
+    assert _emails(conn) == ['a@x.ru']
+
+
+def test_helper_does_not_roll_back_caller(db):
+    conn = database.get_connection()
+    _insert_user(conn, 'a@x.ru')
+    # Помощник с тем же соединением потока не откатывает незакоммиченную вставку
+    assert user_service.user_exists('a@x.ru')
+    conn.commit()
+    assert _emails(conn) == ['a@x.ru']
+
+
+def test_release_rolls_back_and_reuses_connection(db):
+    conn = database.get_connection()
+    _insert_user(conn, 'a@x.ru')
+    database.release_connection()
+    assert not conn.in_transaction
+
+    again = database.get_connection()
+    assert again is conn
+    assert _emails(again) == []
@@ -0,0 +1,185 @@
+import socketserver
+import threading
+import time
+
+import pytest
+from flask import Flask
+from flask_mail import Mail, Message
+
+import mail_queue
+from mail_queue import MailQueue, MailStatusStore
+
+
+class StubConnection:
+    def __init__(self, mail):
+        self.mail = mail
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send(self, message):
+        self.mail.attempts += 1
+        if self.mail.failures:
+            self.mail.failures -= 1
+            raise OSError('connection refused')
+        self.mail.sent.append(message)
+
+
+class StubMail:
+    """Вместо flask_mail.Mail: первые failures отправок падают"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.attempts = 0
+        self.sent = []
+
+    def connect(self):
+        return StubConnection(self)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Минимальный SMTP-сервер: принимает всё и запоминает письма"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 localhost ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                data = []
+                for line in iter(self.rfile.readline, b''):
+                    if line == b'.\r\n':
+                        break
+                    data.append(line)
+                # Медленный сервер: пока один воркер ждёт ответа, письмо берёт другой
+                time.sleep(server.delay)
+                with server.lock:
+                    server.messages.append(b''.join(data))
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.messages = []
+    server.delay = 0.05
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _smtp_app(server):
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=server.server_address[1], MAIL_USE_TLS=False,
+                      MAIL_DEFAULT_SENDER='noreply@sneakerfit.test')
+    return app
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(mail_queue.time, 'sleep', delays.append)
+    return delays
+
+
+def _make_queue(mail, **kwargs):
+    return MailQueue(Flask(__name__), mail, workers=1, max_attempts=3, backoff=0.5, **kwargs)
+
+
+def _wait(queue, job_id):
+    # time.sleep подменён фикстурой sleeps — ждём через Event
+    tick = threading.Event()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        status = queue.status(job_id)
+        if status and status['state'] in ('sent', 'failed'):
+            return status
+        tick.wait(0.01)
+    raise AssertionError(f'mail job {job_id} did not finish')
+
+
+def test_send(db, sleeps):
+    mail = StubMail()
+    queue = _make_queue(mail)
+    job_id = queue.submit('hello')
+    status = _wait(queue, job_id)
+    assert status == {'state': 'sent', 'attempts': 1, 'error': None}
+    assert mail.sent == ['hello']
+    assert sleeps == []
+
+
+def test_retry_with_backoff(db, sleeps):
+    mail = StubMail(failures=2)
+    queue = _make_queue(mail)
+    status = _wait(queue, queue.submit('hello'))
+    assert status == {'state': 'sent', 'attempts': 3, 'error': None}
+    assert mail.sent == ['hello']
+    assert sleeps == [0.5, 1.0]
+
+
+def test_final_failure(db, sleeps):
+    mail = StubMail(failures=10)
+    queue = _make_queue(mail)
+    status = _wait(queue, queue.submit('hello'))
+    assert status == {'state': 'failed', 'attempts': 3, 'error': 'connection refused'}
+    assert mail.attempts == 3
+    assert mail.sent == []
+
+
+def test_status_is_shared_between_queues(db, sleeps):
+    # Два воркера gunicorn — две очереди над одной базой
+    sender = _make_queue(StubMail())
+    other = _make_queue(StubMail())
+    job_id = sender.submit('hello')
+    _wait(sender, job_id)
+    assert other.status(job_id)['state'] == 'sent'
+    assert other.status(sender.submit('again')) is not None
+
+
+def test_job_ids_are_unique(db, sleeps):
+    first, second = _make_queue(StubMail()), _make_queue(StubMail())
+    assert first.submit('a') != second.submit('b')
+
+
+def test_expired_status_is_dropped(db):
+    store = MailStatusStore(ttl=-1)
+    store.create('old')
+    assert store.get('old') is None
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_connection_is_reused_per_worker(db, smtp_server, workers):
+    app = _smtp_app(smtp_server)
+    queue = MailQueue(app, Mail(app), workers=workers, max_attempts=1)
+    with app.app_context():
+        job_ids = [queue.submit(Message(f'Code {i}', recipients=[f'user{i}@x.ru'], body=f'code {i}'))
+                   for i in range(6)]
+    assert all(_wait(queue, job_id)['state'] == 'sent' for job_id in job_ids)
+    assert len(smtp_server.messages) == 6
+    assert all(any(f'code {i}'.encode() in m for m in smtp_server.messages) for i in range(6))
+    # Каждый воркер открыл одно соединение и отправил по нему все свои письма
+    assert smtp_server.connections == workers
@@ -0,0 +1,23 @@
+import database
+
+
+def test_duplicate_usernames_get_unique_suffixes(tmp_path):
+    pool = database.ConnectionPool(str(tmp_path / 'users.db'))
+    conn = pool.acquire()
+    try:
+        # База в состоянии до миграции 3: ники ещё не уникальны
+        database.schema_version(conn)
+        for version, apply in database.MIGRATIONS[:2]:
+            apply(conn)
+            conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+        users = [(1, 'bob'), (2, 'bob'), (3, 'bob_2'), (4, 'bob_2_2'), (5, 'bob')]
+        conn.executemany("INSERT INTO users (id, username, email, password) VALUES (?, ?, ?, 'x')",
+                         [(user_id, name, f'{user_id}@x.ru') for user_id, name in users])
+        conn.commit()
+
+        database.migrate(conn)
+        names = dict(conn.execute("SELECT id, username FROM users").fetchall())
+        assert names == {1: 'bob', 2: 'bob_2_3', 3: 'bob_2', 4: 'bob_2_2', 5: 'bob_5'}
+    finally:
+        conn.close()
+        pool.close_all()
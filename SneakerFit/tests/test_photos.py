@@ -0,0 +1,65 @@
+import os
+
+from PIL import Image
+
+import build_photos
+import photos
+from photos import PhotoDirectoryIndex, PhotoManifest
+
+
+def test_original_urls_keep_the_real_extension(tmp_path, monkeypatch):
+    model_dir = tmp_path / 'Nike Pegasus'
+    model_dir.mkdir()
+    for name in ('1.JPG', '2.jpeg', '3.png', '10.jpg', 'cover.jpg'):
+        (model_dir / name).write_bytes(b'')
+    monkeypatch.setattr(photos, 'photo_index', PhotoDirectoryIndex(str(tmp_path)))
+    monkeypatch.setattr(photos, 'manifest', PhotoManifest(str(tmp_path / 'missing.json')))
+
+    gallery = photos.model_photos('Nike Pegasus')
+    assert [photo['index'] for photo in gallery] == [1, 2, 10]
+    assert [photo['src'].rsplit('/', 1)[1] for photo in gallery] == ['1.JPG', '2.jpeg', '10.jpg']
+    assert gallery[0]['thumb'] == gallery[0]['full'] == '/static/models%20photo/Nike%20Pegasus/1.JPG'
+    assert photos.model_image('Nike Pegasus', 2)['src'].endswith('/2.jpeg')
+
+
+def test_rescans_when_the_folder_changes(tmp_path):
+    model_dir = tmp_path / 'Vans'
+    model_dir.mkdir()
+    (model_dir / '1.jpg').write_bytes(b'')
+    index = PhotoDirectoryIndex(str(tmp_path))
+    assert index.files('Vans') == {1: '1.jpg'}
+    (model_dir / '2.JPEG').write_bytes(b'')
+    # mtime папки на некоторых ФС меняется не сразу — сдвигаем сами
+    stamp = model_dir.stat().st_mtime_ns + 1_000_000_000
+    os.utime(model_dir, ns=(stamp, stamp))
+    assert index.files('Vans') == {1: '1.jpg', 2: '2.JPEG'}
+    assert index.files('Missing') == {}
+
+
+def test_manifest_and_gallery_pick_the_same_file(tmp_path, monkeypatch):
+    model_dir = tmp_path / 'Puma Club'
+    model_dir.mkdir()
+    Image.new('RGB', (300, 200), 'red').save(model_dir / '1.jpg')
+    Image.new('RGB', (300, 200), 'blue').save(model_dir / '1.JPEG', 'JPEG')
+    Image.new('RGB', (300, 200), 'green').save(model_dir / '2.jpeg', 'JPEG')
+    monkeypatch.setattr(build_photos, 'PHOTOS_DIR', str(tmp_path))
+    monkeypatch.setattr(build_photos, 'VARIANTS_DIR', str(tmp_path / 'variants'))
+    monkeypatch.setattr(build_photos, 'MANIFEST_FILE', str(tmp_path / 'variants' / 'manifest.json'))
+
+    entries = build_photos.build_manifest()['models']['Puma Club']
+    assert [(e['index'], e['original']) for e in entries] == [
+        (1, 'models photo/Puma Club/1.JPEG'), (2, 'models photo/Puma Club/2.jpeg')]
+    assert PhotoDirectoryIndex(str(tmp_path)).files('Puma Club') == {1: '1.JPEG', 2: '2.jpeg'}
+
+
+def test_srcset_has_one_entry_per_width():
+    # Оригинал уже 300px: card и full обрезаны до той же ширины
+    variants = {
+        'thumb': {'width': 160, 'jpeg': 't.jpg', 'webp': 't.webp'},
+        'card': {'width': 300, 'jpeg': 'c.jpg', 'webp': 'c.webp'},
+        'full': {'width': 300, 'jpeg': 'f.jpg', 'webp': 'f.webp'},
+    }
+    sources = photos.photo_sources({'variants': variants})
+    assert sources['srcset'] == '/static/t.jpg 160w, /static/c.jpg 300w'
+    assert sources['webpSrcset'] == '/static/t.webp 160w, /static/c.webp 300w'
+    assert sources['full'] == '/static/f.jpg'
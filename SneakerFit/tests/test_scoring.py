@@ -0,0 +1,138 @@
+import random
+
+import numpy as np
+import pytest
+
+from scoring import (CatalogMatrix, _best_sizes_full, _ranges, best_sizes, calculate_compatibility,
+                     length_window_bounds, score_sizes)
+
+FOOT_TYPES = ['Плоскостопие', 'Супинация', 'Нормальная', '', '  ', None]
+# Пустые, нулевые и нечисловые значения calculate_compatibility пропускает
+BAD_VALUES = [None, '', '  ', 0, 'abc']
+
+
+def _size(rng, eu):
+    return {
+        'eu': eu,
+        'length': rng.randint(215, 320) + rng.choice([0, 0.5]),
+        'toeCircumference': rng.randint(200, 270),
+        'midfootCircumference': rng.randint(190, 270),
+        'ankleCircumference': rng.randint(210, 280),
+        'obliqueCircumference': rng.randint(280, 360),
+    }
+
+
+def _catalog(rng, models=30):
+    sneakers = []
+    for i in range(models):
+        sizes = [_size(rng, 36 + j * 0.5) for j in range(rng.randint(1, 14))]
+        # Размеры в каталоге не обязаны идти по возрастанию длины
+        rng.shuffle(sizes)
+        shoe = {'model': f'Model {i}', 'sizes': sizes}
+        if rng.random() < 0.8:
+            shoe['sport'] = rng.choice([0, 1])
+        sneakers.append(shoe)
+    return sneakers
+
+
+def _user(rng):
+    user = {}
+    for key, low, high in (('foot_length', 21.0, 31.0), ('foot_width', 8.0, 12.0),
+                           ('oblique_circumference', 28.0, 36.0)):
+        roll = rng.random()
+        if roll < 0.1:
+            user[key] = rng.choice(BAD_VALUES[:-1])
+        elif roll < 0.15 and key != 'foot_length':
+            user[key] = 'abc'
+        elif roll < 0.6:
+            user[key] = round(rng.uniform(low, high), 1)
+        elif roll < 0.9:
+            user[key] = str(round(rng.uniform(low, high), 1))
+    user['foot_type'] = rng.choice(FOOT_TYPES)
+    return user
+
+
+def _scalar_best(user, sneakers):
+    best, columns = [], []
+    for shoe in sneakers:
+        scores = [calculate_compatibility(user, size, is_sport=shoe.get('sport', 1)) for size in shoe['sizes']]
+        best.append(max(scores))
+        columns.append(scores.index(max(scores)))
+    return best, columns
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_batch_matches_scalar(seed):
+    rng = random.Random(seed)
+    sneakers = _catalog(rng)
+    matrix = CatalogMatrix(sneakers)
+    for _ in range(25):
+        user = _user(rng)
+        expected = [calculate_compatibility(user, size, is_sport=shoe.get('sport', 1))
+                    for shoe in sneakers for size in shoe['sizes']]
+        assert score_sizes(user, matrix).tolist() == expected, user
+
+        best, columns = best_sizes(user, matrix)
+        assert (best.tolist(), columns.tolist()) == _scalar_best(user, sneakers), user
+
+
+@pytest.mark.parametrize('sport', [0, 1])
+@pytest.mark.parametrize('field, value', [
+    (field, value) for field in ('foot_length', 'foot_width', 'oblique_circumference') for value in BAD_VALUES
+] + [('foot_type', value) for value in (None, '', '  ')])
+def test_missing_and_invalid_fields(sport, field, value):
+    rng = random.Random(f'{sport}{field}{value}')
+    sneakers = _catalog(rng, models=10)
+    for shoe in sneakers:
+        shoe['sport'] = sport
+    matrix = CatalogMatrix(sneakers)
+    user = {'foot_length': '26.5', 'foot_width': '10', 'oblique_circumference': '32',
+            'foot_type': 'Плоскостопие', field: value}
+    if field == 'foot_length' and value == 'abc':
+        # Нечисловую длину calculate_compatibility не прощает — и пакетная оценка тоже
+        with pytest.raises(ValueError):
+            calculate_compatibility(user, sneakers[0]['sizes'][0], is_sport=sport)
+        with pytest.raises(ValueError):
+            score_sizes(user, matrix)
+        return
+    expected = [calculate_compatibility(user, size, is_sport=sport)
+                for shoe in sneakers for size in shoe['sizes']]
+    assert score_sizes(user, matrix).tolist() == expected
+    assert [b.tolist() for b in best_sizes(user, matrix)] == list(_scalar_best(user, sneakers))
+
+
+def test_no_measurements():
+    sneakers = _catalog(random.Random(1), models=5)
+    matrix = CatalogMatrix(sneakers)
+    assert not score_sizes({}, matrix).any()
+    assert [b.tolist() for b in best_sizes({}, matrix)] == list(_scalar_best({}, sneakers))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_length_window_is_exact_and_prunes(seed):
+    rng = random.Random(seed)
+    sneakers = _catalog(rng, models=50)
+    matrix = CatalogMatrix(sneakers)
+    pruned = 0
+    for _ in range(30):
+        user = _user(rng)
+        user['foot_length'] = round(rng.uniform(21.0, 31.0), 1)
+        bounds = length_window_bounds(user, matrix)
+        assert bounds is not None
+        rows = matrix.length_order[_ranges(*bounds)]
+        pruned += len(matrix) - len(rows)
+
+        best, columns = best_sizes(user, matrix)
+        full_best, full_columns = _best_sizes_full(user, matrix)
+        assert best.tolist() == full_best.tolist()
+        assert columns.tolist() == full_columns.tolist()
+        # Все размеры вне окна оцениваются строго ниже лучшего размера модели
+        outside = np.setdiff1d(np.arange(len(matrix)), rows)
+        scores = score_sizes(user, matrix)
+        assert (scores[outside] < full_best[matrix.model_index[outside]]).all()
+    assert pruned > 0
+
+
+def test_length_window_without_length():
+    matrix = CatalogMatrix(_catalog(random.Random(2), models=5))
+    assert length_window_bounds({'foot_width': '10'}, matrix) is None
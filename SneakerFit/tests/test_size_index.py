@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from catalog import CatalogSnapshot
+from scoring import calculate_compatibility
+from size_index import nearest_sizes
+from test_scoring import _catalog, _user
+
+
+def _brute_force(user, sneakers, limit):
+    """Все размеры каталога по убыванию оценки, при равенстве — в порядке каталога"""
+    scored = [(calculate_compatibility(user, size, is_sport=shoe.get('sport', 1)), shoe['model'], size)
+              for shoe in sneakers for size in shoe['sizes']]
+    order = sorted(range(len(scored)), key=lambda i: (-scored[i][0], i))[:limit]
+    return [{'model': scored[i][1], 'compatibility': scored[i][0], 'size': scored[i][2]} for i in order]
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('limit', [1, 10, 50])
+def test_matches_brute_force(seed, limit):
+    rng = random.Random(seed)
+    sneakers = _catalog(rng, models=60)
+    snapshot = CatalogSnapshot({'sneakers': sneakers}, version=f'test-{seed}')
+    for _ in range(20):
+        user = _user(rng)
+        if user.get('foot_length') == 'abc':
+            continue
+        assert nearest_sizes(user, snapshot, limit) == _brute_force(user, sneakers, limit), user
+
+
+@pytest.mark.parametrize('user', [
+    {'foot_width': '10.5', 'oblique_circumference': '31', 'foot_type': 'Супинация'},
+    {'foot_length': '', 'foot_width': '9', 'foot_type': 'Плоскостопие'},
+    {},
+])
+def test_user_without_length(user):
+    sneakers = _catalog(random.Random(3), models=60)
+    snapshot = CatalogSnapshot({'sneakers': sneakers}, version='no-length')
+    assert nearest_sizes(user, snapshot, 10) == _brute_force(user, sneakers, 10)
+
+
+def test_empty_catalog():
+    assert nearest_sizes({'foot_length': '26'}, CatalogSnapshot({'sneakers': []}), 10) == []
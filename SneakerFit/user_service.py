@@ -1,4 +1,9 @@
+import logging
+
 from database import get_connection
+from recommendations import refresh_user
+
+logger = logging.getLogger(__name__)
 
 
 def user_exists(email):
@@ -8,11 +13,21 @@ def user_exists(email):
         cursor.execute("SELECT 1 FROM users WHERE email = ?", (email,))
         exists = cursor.fetchone() is not None
         return exists
-    except Exception as e:
-        print(f"Error checking user existence: {e}")
+    except Exception:
+        logger.exception("Error checking user existence")
+        return False
+
+
+def username_exists(username):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        # Точечный поиск по уникальному индексу idx_users_username
+        cursor.execute("SELECT 1 FROM users WHERE username = ? LIMIT 1", (username,))
+        return cursor.fetchone() is not None
+    except Exception:
+        logger.exception("Error checking username existence")
         return False
-    finally:
-        conn.close()
 
 
 def save_user(user_data):
@@ -25,7 +40,7 @@ def save_user_with_verification(user_data):
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        print(f"Attempting to save user with verification: {user_data.get('username')}, {user_data.get('email')}")
+        logger.debug("Saving user", extra={'username': user_data.get('username'), 'email': user_data.get('email')})
 
         cursor.execute("""
             INSERT INTO users 
@@ -49,14 +64,12 @@ def save_user_with_verification(user_data):
             False  # email_verified
         ))
         conn.commit()
-        print(f"User {user_data.get('email')} saved with unverified email")
+        logger.info("User saved with unverified email", extra={'email': user_data.get('email')})
         return True
-    except Exception as e:
-        print(f"Error saving user: {e}")
+    except Exception:
+        logger.exception("Error saving user")
         conn.rollback()
         return False
-    finally:
-        conn.close()
 
 
 def verify_user_email(email):
@@ -70,14 +83,12 @@ def verify_user_email(email):
             WHERE email = ?
         """, (True, email))
         conn.commit()
-        print(f"Email verified for user: {email}")
+        logger.info("Email verified", extra={'email': email})
         return cursor.rowcount > 0
-    except Exception as e:
-        print(f"Error verifying email: {e}")
+    except Exception:
+        logger.exception("Error verifying email")
         conn.rollback()
         return False
-    finally:
-        conn.close()
 
 
 def is_email_verified(email):
@@ -88,11 +99,9 @@ def is_email_verified(email):
         cursor.execute("SELECT email_verified FROM users WHERE email = ?", (email,))
         row = cursor.fetchone()
         return row and row['email_verified'] == 1
-    except Exception as e:
-        print(f"Error checking email verification: {e}")
+    except Exception:
+        logger.exception("Error checking email verification")
         return False
-    finally:
-        conn.close()
 
 
 def get_user_by_email(email):
@@ -104,11 +113,9 @@ def get_user_by_email(email):
         if row:
             return dict(row)
         return None
-    except Exception as e:
-        print(f"Error getting user by email: {e}")
+    except Exception:
+        logger.exception("Error getting user by email")
         return None
-    finally:
-        conn.close()
 
 
 def update_user_measurements(email, data):
@@ -127,15 +134,22 @@ def update_user_measurements(email, data):
             data.get('foot_type', None),
             email
         ))
+        # Подборка обновляется в той же транзакции, что и мерки
+        row = cursor.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        if row:
+            try:
+                refresh_user(conn, dict(row))
+            except Exception:
+                logger.exception("Error refreshing recommendations", extra={'email': email})
+                # Без состояния подборка пересчитается при следующем чтении
+                conn.execute("DELETE FROM recommendation_state WHERE user_id = ?", (row['id'],))
         conn.commit()
-        print(f"Measurements updated for user: {email}")
+        logger.debug("Measurements updated", extra={'email': email})
         return True
-    except Exception as e:
-        print(f"Error updating user measurements: {e}")
+    except Exception:
+        logger.exception("Error updating user measurements")
         conn.rollback()
         return False
-    finally:
-        conn.close()
 
 
 def update_user_profile(email, about=None, avatar_path=None):
@@ -153,14 +167,33 @@ def update_user_profile(email, about=None, avatar_path=None):
         elif avatar_path:
             cursor.execute("UPDATE users SET avatar=? WHERE email=?", (avatar_path, email))
         conn.commit()
-        print(f"Profile updated for user: {email}")
+        logger.debug("Profile updated", extra={'email': email})
         return True
-    except Exception as e:
-        print(f"Error updating user profile: {e}")
+    except Exception:
+        logger.exception("Error updating user profile")
         conn.rollback()
         return False
-    finally:
-        conn.close()
+
+
+def collect_unused_avatar(avatar_path, remove):
+    """Вызывает remove(avatar_path), если аватар ни у кого не указан.
+
+    Проверка и удаление идут в одной транзакции BEGIN IMMEDIATE: ссылка
+    на тот же файл не может закоммититься между ними.
+    """
+    conn = get_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        in_use = conn.execute("SELECT 1 FROM users WHERE avatar = ? LIMIT 1", (avatar_path,)).fetchone()
+        if in_use is None:
+            remove(avatar_path)
+        conn.commit()
+        return in_use is None
+    except Exception:
+        logger.exception("Error collecting avatar", extra={'avatar': avatar_path})
+        conn.rollback()
+        # При ошибке файл остаётся: лучше лишний файл, чем битая ссылка
+        return False
 
 
 def update_user_nickname(email, new_name):
@@ -169,25 +202,41 @@ def update_user_nickname(email, new_name):
     try:
         cursor.execute("UPDATE users SET username=? WHERE email=?", (new_name, email))
         conn.commit()
-        print(f"Nickname updated for user: {email} -> {new_name}")
+        logger.info("Nickname updated", extra={'email': email, 'username': new_name})
         return True
-    except Exception as e:
-        print(f"Error updating user nickname: {e}")
+    except Exception:
+        logger.exception("Error updating user nickname")
         conn.rollback()
         return False
-    finally:
-        conn.close()
 
 
-def get_all_users():
+USERS_PAGE_SIZE = 100
+
+
+def _prefix_range(prefix):
+    # Все строки с префиксом лежат в [prefix, prefix + U+10FFFF): так поиск идёт по индексу
+    return prefix, prefix + '\U0010ffff'
+
+
+def iter_users(after_id=0, limit=USERS_PAGE_SIZE, prefix=None):
+    """Страница пользователей с id больше after_id, только столбцы для списка.
+
+    Строки отдаются по мере чтения курсора. С prefix ищет по началу
+    имени или email через индексы idx_users_username и email.
+    """
     conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM users")
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
-    except Exception as e:
-        print(f"Error getting all users: {e}")
-        return []
-    finally:
-        conn.close()
\ No newline at end of file
+        sql = "SELECT id, username, email, email_verified FROM users WHERE id > ?"
+        params = [after_id]
+        if prefix:
+            low, high = _prefix_range(prefix)
+            # Два диапазона по индексам; OR в одном WHERE SQLite решает полным проходом по id
+            sql += (" AND id IN (SELECT id FROM users WHERE username >= ? AND username < ?"
+                    " UNION ALL SELECT id FROM users WHERE email >= ? AND email < ?)")
+            params += [low, high, low, high]
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        for row in conn.execute(sql, params):
+            yield dict(row)
+    except Exception:
+        logger.exception("Error listing users")
\ No newline at end of file